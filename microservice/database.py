@@ -1,12 +1,269 @@
 import os
-import json
+import io
+import csv
+import gzip
+import random
+import asyncio
 import logging
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple, Callable, Set
 import httpx
+import msgspec
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# Supabase responses worth retrying rather than dropping the write. Both mean the
+# insert was refused; a 502/504 gateway error may come after the row committed,
+# so retrying those could duplicate it.
+RETRYABLE_STATUS_CODES = (429, 503)
+
+# Transport failures where the request never reached Supabase. Inserts aren't
+# idempotent, so errors after sending (e.g. read timeouts) are not retried.
+RETRYABLE_TRANSPORT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+# Longest Retry-After honoured, in seconds, so a worker is never parked indefinitely
+RETRY_AFTER_MAX = 5.0
+
+# Static values for every hotel_quote_requests row; each row still carries every
+# key so array inserts see a uniform column set
+_REQUEST_DEFAULTS = {
+    "processing_status": "completed",
+    "urls_found": (),
+    "sources_used": (),
+    "firecrawl_scraped": False
+}
+
+# Failures a storage call logs and reports instead of raising; anything else is a bug
+STORAGE_ERRORS = (
+    httpx.HTTPError,
+    KeyError,
+    ValueError,
+    orjson.JSONEncodeError,
+    msgspec.EncodeError
+)
+
+# Request bodies at least this large are gzip-compressed before sending, but only
+# with SUPABASE_GZIP_REQUESTS=1: PostgREST itself doesn't decode Content-Encoding,
+# so enable it only behind a gateway that does
+GZIP_REQUESTS = os.getenv('SUPABASE_GZIP_REQUESTS', '').lower() in ('1', 'true', 'yes')
+GZIP_MIN_BYTES = 1024
+
+# Columns returned by get_recent_requests unless the caller asks for more
+RECENT_REQUEST_COLUMNS = (
+    "id",
+    "created_at",
+    "email_file_name",
+    "proposal_file_name",
+    "processing_status",
+    "content_length"
+)
+
+# Background write queue sizing: pending quotes, concurrent batch writes, rows per flush and flush delay
+WRITE_QUEUE_SIZE = 1000
+WRITE_WORKERS = 4
+WRITE_BATCH_SIZE = 16
+WRITE_FLUSH_INTERVAL = 0.05
+
+# How long store_hotel_quote_request waits for concurrent calls to share its insert
+REQUEST_COALESCE_WINDOW = 0.005
+
+# Concession batches larger than this are sent to PostgREST as CSV
+CSV_BULK_THRESHOLD = 100
+
+def _csv_value(value: Any) -> str:
+    """Render a value as the text PostgREST would store for its JSON equivalent"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        return value
+    # Numbers, booleans and nested lists/dicts as JSON text, not Python repr
+    return orjson.dumps(value).decode()
+
+def _csv_safe(rows: List[Dict[str, Any]]) -> bool:
+    """False if any text is the literal NULL, which PostgREST CSV can't tell apart from SQL null"""
+    return not any(v == "NULL" for row in rows for v in row.values())
+
+def _rows_to_csv(rows: List[Dict[str, Any]]) -> bytes:
+    """Encode rows sharing the same keys as a PostgREST CSV body (NULL marks SQL null)"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(rows[0].keys())
+    for row in rows:
+        writer.writerow(_csv_value(v) for v in row.values())
+    return buf.getvalue().encode()
+
+async def _next_batch(queue: asyncio.Queue, max_size: int, window: float) -> List[Any]:
+    """Wait for one queue item, then collect more until max_size or the window closes"""
+    loop = asyncio.get_running_loop()
+    batch = [await queue.get()]
+    deadline = loop.time() + window
+    while len(batch) < max_size:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+class QuoteInsert(msgspec.Struct):
+    """Row shape for the hotel_quote_data table"""
+    request_id: str
+    
+    total_quote_status: Optional[str] = None
+    total_quote_value: Optional[float] = None
+    total_quote_currency: Optional[str] = "USD"
+    total_quote_provenance: Optional[str] = None
+    total_quote_notes: Optional[str] = None
+    
+    guestroom_total_status: Optional[str] = None
+    guestroom_total_value: Optional[float] = None
+    guestroom_total_currency: Optional[str] = "USD"
+    guestroom_total_provenance: Optional[str] = None
+    guestroom_total_notes: Optional[str] = None
+    
+    meeting_room_total_status: Optional[str] = None
+    meeting_room_total_value: Optional[float] = None
+    meeting_room_total_currency: Optional[str] = "USD"
+    meeting_room_total_provenance: Optional[str] = None
+    meeting_room_total_notes: Optional[str] = None
+    
+    fnb_total_status: Optional[str] = None
+    fnb_total_value: Optional[float] = None
+    fnb_total_currency: Optional[str] = "USD"
+    fnb_total_provenance: Optional[str] = None
+    fnb_total_notes: Optional[str] = None
+    
+    # Extras
+    room_nights: Optional[int] = None
+    nightly_rate: Optional[float] = None
+    tax_rate_pct: Optional[float] = None
+    service_rate_pct: Optional[float] = None
+    fnb_minimum: Optional[float] = None
+    proposal_url: Optional[str] = None
+    guestroom_base: Optional[float] = None
+    guestroom_taxes_fees: Optional[float] = None
+    estimated_fnb_gross: Optional[float] = None
+    effective_value_offsets: str = "[]"
+
+def _request_row(
+    email_content: Optional[str] = None,
+    email_file_name: Optional[str] = None,
+    email_file_size: Optional[int] = None,
+    proposal_file_name: Optional[str] = None,
+    proposal_file_size: Optional[int] = None,
+    proposal_url: Optional[str] = None,
+    urls_found: Optional[List[str]] = None,
+    sources_used: Optional[List[str]] = None,
+    content_length: Optional[int] = None,
+    firecrawl_scraped: bool = False,
+    firecrawl_content_length: Optional[int] = None
+) -> Dict[str, Any]:
+    """Build a hotel_quote_requests row"""
+    row = {
+        **_REQUEST_DEFAULTS,
+        "email_content": email_content,
+        "email_file_name": email_file_name,
+        "email_file_size": email_file_size,
+        "proposal_file_name": proposal_file_name,
+        "proposal_file_size": proposal_file_size,
+        "proposal_url": proposal_url,
+        "content_length": content_length,
+        "firecrawl_content_length": firecrawl_content_length
+    }
+    if urls_found:
+        row["urls_found"] = urls_found
+    if sources_used:
+        row["sources_used"] = sources_used
+    if firecrawl_scraped:
+        row["firecrawl_scraped"] = firecrawl_scraped
+    return row
+
+def _quote_row(request_id: str, quote_data: Dict[str, Any]) -> QuoteInsert:
+    """Build a hotel_quote_data row from the extracted quote"""
+    # Look up each section once
+    tq = quote_data.get('total_quote') or {}
+    gr = quote_data.get('guestroom_total') or {}
+    mr = quote_data.get('meeting_room_total') or {}
+    fb = quote_data.get('fnb_total') or {}
+    ex = quote_data.get('extras') or {}
+    
+    return QuoteInsert(
+        request_id=request_id,
+        total_quote_status=tq.get('status'),
+        total_quote_value=tq.get('value'),
+        total_quote_currency=tq.get('currency', 'USD'),
+        total_quote_provenance=tq.get('provenance_snippet'),
+        total_quote_notes=tq.get('notes'),
+        
+        guestroom_total_status=gr.get('status'),
+        guestroom_total_value=gr.get('value'),
+        guestroom_total_currency=gr.get('currency', 'USD'),
+        guestroom_total_provenance=gr.get('provenance_snippet'),
+        guestroom_total_notes=gr.get('notes'),
+        
+        meeting_room_total_status=mr.get('status'),
+        meeting_room_total_value=mr.get('value'),
+        meeting_room_total_currency=mr.get('currency', 'USD'),
+        meeting_room_total_provenance=mr.get('provenance_snippet'),
+        meeting_room_total_notes=mr.get('notes'),
+        
+        fnb_total_status=fb.get('status'),
+        fnb_total_value=fb.get('value'),
+        fnb_total_currency=fb.get('currency', 'USD'),
+        fnb_total_provenance=fb.get('provenance_snippet'),
+        fnb_total_notes=fb.get('notes'),
+        
+        # Extras
+        room_nights=ex.get('room_nights'),
+        nightly_rate=ex.get('nightly_rate'),
+        tax_rate_pct=ex.get('tax_rate_pct'),
+        service_rate_pct=ex.get('service_rate_pct'),
+        fnb_minimum=ex.get('fnb_minimum'),
+        proposal_url=ex.get('proposal_url'),
+        guestroom_base=ex.get('guestroom_base'),
+        guestroom_taxes_fees=ex.get('guestroom_taxes_fees'),
+        estimated_fnb_gross=ex.get('estimated_fnb_gross'),
+        effective_value_offsets=orjson.dumps(ex.get('effective_value_offsets', [])).decode()
+    )
+
+def _property_row(request_id: str, property_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Build a hotel_properties row"""
+    return {
+        "request_id": request_id,
+        "name": property_data.get('name'),
+        "address": property_data.get('address'),
+        "phone": property_data.get('phone'),
+        "website": property_data.get('website'),
+        "contact_name": property_data.get('contact_name'),
+        "contact_email": property_data.get('contact_email'),
+        "contact_phone": property_data.get('contact_phone'),
+        "property_data": orjson.dumps(property_data).decode()
+    }
+
+def _concession_rows(request_id: str, concessions: List[Any]) -> List[Dict[str, Any]]:
+    """Build hotel_concessions rows, skipping concessions without text.
+    
+    The prompt asks for plain strings; objects with a `text` field are accepted too.
+    """
+    rows = []
+    for concession in concessions:
+        if isinstance(concession, str):
+            concession = {"text": concession}
+        elif not isinstance(concession, dict):
+            logger.warning(f"Skipping malformed concession for request {request_id}: {concession!r}")
+            continue
+        if concession.get('text'):
+            rows.append({
+                "request_id": request_id,
+                "concession_text": concession.get('text'),
+                "concession_type": concession.get('type'),
+                "value_impact": concession.get('value_impact'),
+                "conditions": concession.get('conditions')
+            })
+    return rows
+
 class SupabaseClient:
     def __init__(self):
         self.supabase_url = os.getenv('SUPABASE_URL')
@@ -18,6 +275,122 @@ class SupabaseClient:
         else:
             self.enabled = True
             logger.info("Supabase client initialized")
+
+        # Per-call headers and endpoints are fixed, so build them once
+        self._write_headers = {"Prefer": "return=representation"}
+        self._write_headers_minimal = {"Prefer": "return=minimal"}
+        self._csv_headers_minimal = {"Content-Type": "text/csv", "Prefer": "return=minimal"}
+        self._endpoints = {
+            "requests": "/rest/v1/hotel_quote_requests",
+            "quote_data": "/rest/v1/hotel_quote_data",
+            "properties": "/rest/v1/hotel_properties",
+            "concessions": "/rest/v1/hotel_concessions"
+        }
+        
+        # Background write queue, started by start() once an event loop is running
+        self._queue: Optional[asyncio.Queue] = None
+        self._request_queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._writers: Set[asyncio.Task] = set()
+        
+        # Shared HTTP client so every call reuses the same connection pool
+        self._client = None
+        if self.enabled:
+            self._client = httpx.AsyncClient(
+                base_url=self.supabase_url,
+                headers={
+                    "apikey": self.supabase_key,
+                    "Authorization": f"Bearer {self.supabase_key}",
+                    "Content-Type": "application/json",
+                    "Accept-Encoding": "gzip"
+                },
+                http2=True,
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
+                # Fail fast on connect so retries kick in; allow longer for reads and writes
+                timeout=httpx.Timeout(connect=1.0, read=5.0, write=5.0, pool=2.0)
+            )
+
+    async def check_connection(self) -> None:
+        """Warn if Supabase is not being reached over HTTP/2"""
+        if not self.enabled:
+            return
+        try:
+            response = await self._client.get("/rest/v1/")
+            if response.http_version != "HTTP/2":
+                logger.warning(f"Supabase connection negotiated {response.http_version}, inserts will not be multiplexed")
+        except httpx.HTTPError as e:
+            logger.warning(f"Supabase connection check failed: {e}")
+    
+    async def start(self) -> None:
+        """Start the background workers that drain the write queues"""
+        if not self.enabled or self._workers:
+            return
+        self._queue = asyncio.Queue(maxsize=WRITE_QUEUE_SIZE)
+        self._request_queue = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker()),
+            asyncio.create_task(self._request_batcher())
+        ]
+    
+    async def aclose(self):
+        """Flush pending writes, stop the workers and close the shared HTTP client"""
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=10.0)
+            except asyncio.TimeoutError:
+                logger.warning(f"Dropping {self._queue.qsize()} queued quotes on shutdown")
+            tasks = [*self._workers, *self._writers]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._workers = []
+            self._writers.clear()
+            self._queue = self._request_queue = None
+        if self._client is not None:
+            await self._client.aclose()
+    
+    def _concession_body(self, rows: List[Dict[str, Any]]) -> Tuple[Dict[str, str], bytes]:
+        """Pick headers and encoding for a concessions insert"""
+        if len(rows) > CSV_BULK_THRESHOLD and _csv_safe(rows):
+            return self._csv_headers_minimal, _rows_to_csv(rows)
+        return self._write_headers_minimal, orjson.dumps(rows)
+    
+    async def _post_with_retry(
+        self,
+        url: str,
+        *,
+        headers: Dict[str, str],
+        content: bytes,
+        max_attempts: int = 3
+    ) -> httpx.Response:
+        """POST with exponential backoff on 429/503 responses and connection failures.
+        
+        `content` is the already-encoded body, so retries resend the same bytes
+        instead of re-serializing the payload. With GZIP_REQUESTS, large bodies are
+        gzip-compressed once up front.
+        """
+        if GZIP_REQUESTS and len(content) >= GZIP_MIN_BYTES:
+            content = gzip.compress(content, compresslevel=1)
+            headers = {**headers, "Content-Encoding": "gzip"}
+        
+        for attempt in range(max_attempts):
+            try:
+                response = await self._client.post(url, headers=headers, content=content)
+            except RETRYABLE_TRANSPORT_ERRORS as e:
+                if attempt == max_attempts - 1:
+                    raise
+                logger.warning(f"Supabase request to {url} failed ({e!r}), retrying")
+                delay = 0.1 * 2 ** attempt + random.random() * 0.05
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == max_attempts - 1:
+                    return response
+                logger.warning(f"Supabase returned {response.status_code} for {url}, retrying")
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = min(float(retry_after), RETRY_AFTER_MAX)
+                else:
+                    delay = 0.1 * 2 ** attempt + random.random() * 0.05
+            await asyncio.sleep(delay)
     
     async def store_hotel_quote_request(
         self,
@@ -38,44 +411,72 @@ class SupabaseClient:
             logger.warning("Supabase not enabled, skipping database storage")
             return None
             
+        row = _request_row(
+            email_content=email_content,
+            email_file_name=email_file_name,
+            email_file_size=email_file_size,
+            proposal_file_name=proposal_file_name,
+            proposal_file_size=proposal_file_size,
+            proposal_url=proposal_url,
+            urls_found=urls_found,
+            sources_used=sources_used,
+            content_length=content_length,
+            firecrawl_scraped=firecrawl_scraped,
+            firecrawl_content_length=firecrawl_content_length
+        )
+        
+        # Concurrent callers are coalesced into one array insert by _request_batcher
+        if self._request_queue is not None:
+            future = asyncio.get_running_loop().create_future()
+            self._request_queue.put_nowait((row, future))
+            return await future
+        
+        return (await self._insert_requests([row]))[0]
+    
+    async def _insert_requests(self, rows: List[Dict[str, Any]]) -> List[Optional[str]]:
+        """Insert hotel_quote_requests rows and return their IDs in order (None on failure)"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.supabase_url}/rest/v1/hotel_quote_requests",
-                    headers={
-                        "apikey": self.supabase_key,
-                        "Authorization": f"Bearer {self.supabase_key}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=representation"
-                    },
-                    json={
-                        "email_content": email_content,
-                        "email_file_name": email_file_name,
-                        "email_file_size": email_file_size,
-                        "proposal_file_name": proposal_file_name,
-                        "proposal_file_size": proposal_file_size,
-                        "proposal_url": proposal_url,
-                        "urls_found": urls_found or [],
-                        "sources_used": sources_used or [],
-                        "content_length": content_length,
-                        "firecrawl_scraped": firecrawl_scraped,
-                        "firecrawl_content_length": firecrawl_content_length,
-                        "processing_status": "completed"
-                    }
-                )
+            response = await self._post_with_retry(
+                self._endpoints["requests"],
+                headers=self._write_headers,
+                content=orjson.dumps(rows)
+            )
+            
+            if response.status_code == 201:
+                request_ids = [row['id'] for row in orjson.loads(response.content)]
+                logger.info(f"Stored hotel quote requests with IDs: {request_ids}")
+                return request_ids
+            
+            logger.error(f"Failed to store request: {response.status_code} - {response.text}")
+            if len(rows) > 1:
+                # PostgREST inserts an array in one transaction, so one rejected row fails
+                # them all; retry each row on its own
+                return [ids[0] for ids in await asyncio.gather(*(self._insert_requests([row]) for row in rows))]
+            return [None]
                 
-                if response.status_code == 201:
-                    result = response.json()
-                    request_id = result[0]['id'] if result else None
-                    logger.info(f"Stored hotel quote request with ID: {request_id}")
-                    return request_id
-                else:
-                    logger.error(f"Failed to store request: {response.status_code} - {response.text}")
-                    return None
-                    
-        except Exception as e:
+        except STORAGE_ERRORS as e:
             logger.error(f"Error storing hotel quote request: {e}")
-            return None
+            return [None] * len(rows)
+    
+    async def _request_batcher(self) -> None:
+        """Coalesce store_hotel_quote_request calls arriving within REQUEST_COALESCE_WINDOW"""
+        while True:
+            batch = await _next_batch(self._request_queue, WRITE_BATCH_SIZE, REQUEST_COALESCE_WINDOW)
+            try:
+                request_ids = await self._insert_requests([row for row, _ in batch])
+                if len(request_ids) != len(batch):
+                    logger.error(f"Supabase returned {len(request_ids)} IDs for {len(batch)} requests")
+                for (_, future), request_id in zip(batch, request_ids):
+                    if not future.done():
+                        future.set_result(request_id)
+            except Exception:
+                # Keep coalescing for later callers, but surface the failure with its traceback
+                logger.exception(f"Unexpected error storing {len(batch)} coalesced requests")
+            finally:
+                # Callers wait on these futures, so any still unanswered get None (not stored)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
     
     async def store_hotel_quote_data(
         self,
@@ -88,66 +489,22 @@ class SupabaseClient:
             return False
             
         try:
-            # Extract the main quote data
-            quote_insert = {
-                "request_id": request_id,
-                "total_quote_status": quote_data.get('total_quote', {}).get('status'),
-                "total_quote_value": quote_data.get('total_quote', {}).get('value'),
-                "total_quote_currency": quote_data.get('total_quote', {}).get('currency', 'USD'),
-                "total_quote_provenance": quote_data.get('total_quote', {}).get('provenance_snippet'),
-                "total_quote_notes": quote_data.get('total_quote', {}).get('notes'),
-                
-                "guestroom_total_status": quote_data.get('guestroom_total', {}).get('status'),
-                "guestroom_total_value": quote_data.get('guestroom_total', {}).get('value'),
-                "guestroom_total_currency": quote_data.get('guestroom_total', {}).get('currency', 'USD'),
-                "guestroom_total_provenance": quote_data.get('guestroom_total', {}).get('provenance_snippet'),
-                "guestroom_total_notes": quote_data.get('guestroom_total', {}).get('notes'),
-                
-                "meeting_room_total_status": quote_data.get('meeting_room_total', {}).get('status'),
-                "meeting_room_total_value": quote_data.get('meeting_room_total', {}).get('value'),
-                "meeting_room_total_currency": quote_data.get('meeting_room_total', {}).get('currency', 'USD'),
-                "meeting_room_total_provenance": quote_data.get('meeting_room_total', {}).get('provenance_snippet'),
-                "meeting_room_total_notes": quote_data.get('meeting_room_total', {}).get('notes'),
-                
-                "fnb_total_status": quote_data.get('fnb_total', {}).get('status'),
-                "fnb_total_value": quote_data.get('fnb_total', {}).get('value'),
-                "fnb_total_currency": quote_data.get('fnb_total', {}).get('currency', 'USD'),
-                "fnb_total_provenance": quote_data.get('fnb_total', {}).get('provenance_snippet'),
-                "fnb_total_notes": quote_data.get('fnb_total', {}).get('notes'),
-                
-                # Extras
-                "room_nights": quote_data.get('extras', {}).get('room_nights'),
-                "nightly_rate": quote_data.get('extras', {}).get('nightly_rate'),
-                "tax_rate_pct": quote_data.get('extras', {}).get('tax_rate_pct'),
-                "service_rate_pct": quote_data.get('extras', {}).get('service_rate_pct'),
-                "fnb_minimum": quote_data.get('extras', {}).get('fnb_minimum'),
-                "proposal_url": quote_data.get('extras', {}).get('proposal_url'),
-                "guestroom_base": quote_data.get('extras', {}).get('guestroom_base'),
-                "guestroom_taxes_fees": quote_data.get('extras', {}).get('guestroom_taxes_fees'),
-                "estimated_fnb_gross": quote_data.get('extras', {}).get('estimated_fnb_gross'),
-                "effective_value_offsets": json.dumps(quote_data.get('extras', {}).get('effective_value_offsets', []))
-            }
+            quote_insert = _quote_row(request_id, quote_data)
+            
+            response = await self._post_with_retry(
+                self._endpoints["quote_data"],
+                headers=self._write_headers_minimal,
+                content=msgspec.json.encode(quote_insert)
+            )
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.supabase_url}/rest/v1/hotel_quote_data",
-                    headers={
-                        "apikey": self.supabase_key,
-                        "Authorization": f"Bearer {self.supabase_key}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=representation"
-                    },
-                    json=quote_insert
-                )
+            if response.status_code == 201:
+                logger.info(f"Stored hotel quote data for request: {request_id}")
+                return True
+            else:
+                logger.error(f"Failed to store quote data: {response.status_code} - {response.text}")
+                return False
                 
-                if response.status_code == 201:
-                    logger.info(f"Stored hotel quote data for request: {request_id}")
-                    return True
-                else:
-                    logger.error(f"Failed to store quote data: {response.status_code} - {response.text}")
-                    return False
-                    
-        except Exception as e:
+        except STORAGE_ERRORS as e:
             logger.error(f"Error storing hotel quote data: {e}")
             return False
     
@@ -161,36 +518,20 @@ class SupabaseClient:
             return False
             
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.supabase_url}/rest/v1/hotel_properties",
-                    headers={
-                        "apikey": self.supabase_key,
-                        "Authorization": f"Bearer {self.supabase_key}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=representation"
-                    },
-                    json={
-                        "request_id": request_id,
-                        "name": property_data.get('name'),
-                        "address": property_data.get('address'),
-                        "phone": property_data.get('phone'),
-                        "website": property_data.get('website'),
-                        "contact_name": property_data.get('contact_name'),
-                        "contact_email": property_data.get('contact_email'),
-                        "contact_phone": property_data.get('contact_phone'),
-                        "property_data": json.dumps(property_data)
-                    }
-                )
+            response = await self._post_with_retry(
+                self._endpoints["properties"],
+                headers=self._write_headers_minimal,
+                content=orjson.dumps(_property_row(request_id, property_data))
+            )
+            
+            if response.status_code == 201:
+                logger.info(f"Stored property info for request: {request_id}")
+                return True
+            else:
+                logger.error(f"Failed to store property info: {response.status_code} - {response.text}")
+                return False
                 
-                if response.status_code == 201:
-                    logger.info(f"Stored property info for request: {request_id}")
-                    return True
-                else:
-                    logger.error(f"Failed to store property info: {response.status_code} - {response.text}")
-                    return False
-                    
-        except Exception as e:
+        except STORAGE_ERRORS as e:
             logger.error(f"Error storing property info: {e}")
             return False
     
@@ -204,63 +545,195 @@ class SupabaseClient:
             return False
             
         try:
-            concession_inserts = []
-            for concession in concessions:
-                concession_inserts.append({
-                    "request_id": request_id,
-                    "concession_text": concession.get('text'),
-                    "concession_type": concession.get('type'),
-                    "value_impact": concession.get('value_impact'),
-                    "conditions": concession.get('conditions')
-                })
+            concession_inserts = _concession_rows(request_id, concessions)
+            if not concession_inserts:
+                return True
+            headers, body = self._concession_body(concession_inserts)
+            
+            response = await self._post_with_retry(
+                self._endpoints["concessions"],
+                headers=headers,
+                content=body
+            )
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.supabase_url}/rest/v1/hotel_concessions",
-                    headers={
-                        "apikey": self.supabase_key,
-                        "Authorization": f"Bearer {self.supabase_key}",
-                        "Content-Type": "application/json",
-                        "Prefer": "return=representation"
-                    },
-                    json=concession_inserts
-                )
+            if response.status_code == 201:
+                logger.info(f"Stored {len(concession_inserts)} concessions for request: {request_id}")
+                return True
+            else:
+                logger.error(f"Failed to store concessions: {response.status_code} - {response.text}")
+                return False
                 
-                if response.status_code == 201:
-                    logger.info(f"Stored {len(concessions)} concessions for request: {request_id}")
-                    return True
-                else:
-                    logger.error(f"Failed to store concessions: {response.status_code} - {response.text}")
-                    return False
-                    
-        except Exception as e:
+        except STORAGE_ERRORS as e:
             logger.error(f"Error storing concessions: {e}")
             return False
     
-    async def get_recent_requests(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get recent hotel quote requests"""
+    async def store_full_quote(
+        self,
+        request_data: Dict[str, Any],
+        quote_data: Dict[str, Any],
+        property_data: Optional[Dict[str, Any]] = None,
+        concessions: Optional[List[Dict[str, Any]]] = None
+    ) -> Optional[str]:
+        """Store a request and its dependent rows, returning the request ID"""
+        request_id = await self.store_hotel_quote_request(**request_data)
+        if not request_id:
+            return None
+        
+        # The dependent rows only share request_id, so write them concurrently
+        writes = [self.store_hotel_quote_data(request_id, quote_data)]
+        if property_data:
+            writes.append(self.store_property_info(request_id, property_data))
+        if concessions:
+            writes.append(self.store_concessions(request_id, concessions))
+        await asyncio.gather(*writes)
+        
+        return request_id
+    
+    def enqueue_full_quote(self, payload: Dict[str, Any]) -> bool:
+        """Queue a store_full_quote payload for background writing; False if not queued"""
         if not self.enabled:
+            return False
+        if self._queue is None:
+            logger.warning("Supabase write queue not running")
+            return False
+        try:
+            self._queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            logger.warning("Supabase write queue full")
+            return False
+    
+    async def _worker(self) -> None:
+        """Drain the write queue in batches of up to WRITE_BATCH_SIZE, writing up to WRITE_WORKERS at once.
+        
+        A single consumer forms the batches, so quotes arriving together share one
+        insert instead of being split across competing consumers.
+        """
+        writers = asyncio.Semaphore(WRITE_WORKERS)
+        while True:
+            batch = await _next_batch(self._queue, WRITE_BATCH_SIZE, WRITE_FLUSH_INTERVAL)
+            await writers.acquire()
+            task = asyncio.create_task(self._write_batch(batch, writers))
+            self._writers.add(task)
+            task.add_done_callback(self._writers.discard)
+    
+    async def _write_batch(self, batch: List[Dict[str, Any]], writers: asyncio.Semaphore) -> None:
+        """Store one batch, logging failures so the worker keeps going"""
+        try:
+            await self._store_batch(batch)
+        except STORAGE_ERRORS as e:
+            logger.error(f"Error storing batch of {len(batch)} quotes: {e}")
+        except Exception:
+            # Keep the worker alive, but surface the unexpected failure with its traceback
+            logger.exception(f"Unexpected error storing batch of {len(batch)} quotes")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+            writers.release()
+    
+    async def _insert_batch(
+        self,
+        url: str,
+        rows: List[Any],
+        encode: Callable[[List[Any]], Tuple[Dict[str, str], bytes]]
+    ) -> None:
+        """Array-insert rows, retrying them one at a time if PostgREST rejects the array"""
+        headers, body = encode(rows)
+        response = await self._post_with_retry(url, headers=headers, content=body)
+        if response.status_code == 201:
+            return
+        logger.error(f"Failed to store batch rows: {response.status_code} - {response.text}")
+        if len(rows) == 1:
+            return
+        
+        # One rejected row fails the whole array insert, so isolate it
+        failed = 0
+        for row in rows:
+            headers, body = encode([row])
+            try:
+                response = await self._post_with_retry(url, headers=headers, content=body)
+            except STORAGE_ERRORS as e:
+                logger.error(f"Error storing row for {url}: {e}")
+                failed += 1
+                continue
+            if response.status_code != 201:
+                logger.error(f"Failed to store row for {url}: {response.status_code} - {response.text}")
+                failed += 1
+        logger.info(f"Stored {len(rows) - failed} of {len(rows)} rows for {url} one at a time")
+    
+    def _json_body(self, rows: List[Any]) -> Tuple[Dict[str, str], bytes]:
+        return self._write_headers_minimal, orjson.dumps(rows)
+    
+    def _quote_body(self, rows: List[QuoteInsert]) -> Tuple[Dict[str, str], bytes]:
+        return self._write_headers_minimal, msgspec.json.encode(rows)
+    
+    async def _store_batch(self, batch: List[Dict[str, Any]]) -> None:
+        """Write a batch of full quotes as one array insert per table"""
+        request_ids = await self._insert_requests([_request_row(**item["request_data"]) for item in batch])
+        
+        quote_rows = []
+        property_rows = []
+        concession_rows = []
+        for request_id, item in zip(request_ids, batch):
+            if request_id is None:
+                continue
+            # Build each quote's rows on their own so one malformed extraction
+            # doesn't drop the rest of the batch
+            try:
+                quote_row = _quote_row(request_id, item["quote_data"])
+                property_row = _property_row(request_id, item["property_data"]) if item.get("property_data") else None
+                item_concessions = _concession_rows(request_id, item["concessions"]) if item.get("concessions") else []
+            except Exception:
+                logger.exception(f"Skipping quote rows for request {request_id}")
+                continue
+            quote_rows.append(quote_row)
+            if property_row is not None:
+                property_rows.append(property_row)
+            concession_rows.extend(item_concessions)
+        
+        writes = []
+        if quote_rows:
+            writes.append(self._insert_batch(self._endpoints["quote_data"], quote_rows, self._quote_body))
+        if property_rows:
+            writes.append(self._insert_batch(self._endpoints["properties"], property_rows, self._json_body))
+        if concession_rows:
+            writes.append(self._insert_batch(self._endpoints["concessions"], concession_rows, self._concession_body))
+        await asyncio.gather(*writes)
+        logger.info(f"Stored batch of {len(batch)} quotes with request IDs: {request_ids}")
+    
+    async def get_recent_requests(
+        self,
+        limit: int = 10,
+        offset: int = 0,
+        columns: Tuple[str, ...] = ()
+    ) -> List[Dict[str, Any]]:
+        """Get recent hotel quote requests, projecting only the listing columns plus any extra `columns`"""
+        if not self.enabled or limit <= 0:
             return []
             
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.supabase_url}/rest/v1/hotel_quote_requests?select=*&order=created_at.desc&limit={limit}",
-                    headers={
-                        "apikey": self.supabase_key,
-                        "Authorization": f"Bearer {self.supabase_key}"
-                    }
-                )
+            select = ",".join(RECENT_REQUEST_COLUMNS + tuple(c for c in columns if c not in RECENT_REQUEST_COLUMNS))
+            response = await self._client.get(
+                f"{self._endpoints['requests']}?select={select}&order=created_at.desc",
+                headers={"Range-Unit": "items", "Range": f"{offset}-{offset + limit - 1}"}
+            )
+            
+            if response.status_code in (200, 206):
+                return orjson.loads(response.content)
+            else:
+                logger.error(f"Failed to get recent requests: {response.status_code} - {response.text}")
+                return []
                 
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Failed to get recent requests: {response.status_code} - {response.text}")
-                    return []
-                    
-        except Exception as e:
+        except STORAGE_ERRORS as e:
             logger.error(f"Error getting recent requests: {e}")
             return []
 
-# Global Supabase client instance
-supabase_client = SupabaseClient()
+# Global Supabase client instance, built on first use rather than at import time
+_supabase_client: Optional[SupabaseClient] = None
+
+def get_supabase_client() -> SupabaseClient:
+    """Return the shared Supabase client, creating it on first call"""
+    global _supabase_client
+    if _supabase_client is None:
+        _supabase_client = SupabaseClient()
+    return _supabase_client
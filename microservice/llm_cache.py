@@ -0,0 +1,153 @@
+import os
+import time
+import sqlite3
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, Any, Optional
+import orjson
+
+# Redis is optional; without it (or without REDIS_URL) the cache is a pass-through
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import RedisError
+except ImportError:
+    aioredis = None
+    
+    class RedisError(Exception):
+        """Stand-in so the except clauses below still name a type; never raised"""
+
+logger = logging.getLogger(__name__)
+
+# Seconds a cached extraction stays valid
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', '3600'))
+
+# SQLite file used as the LLM cache when Redis isn't configured (e.g. local dev and smoke tests)
+LLM_CACHE_DB = os.getenv('LLM_CACHE_DB')
+
+# Errors from either cache backend; a failing cache never fails the extraction
+CACHE_ERRORS = (RedisError, sqlite3.Error)
+
+_redis = None
+_local = None
+
+class LLMCache:
+    """On-disk LLM response cache in a single SQLite table, with entries expiring after `ttl` seconds"""
+
+    def __init__(self, path: str, ttl: int = LLM_CACHE_TTL):
+        self.ttl = ttl
+        self.con = sqlite3.connect(path, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("CREATE TABLE IF NOT EXISTS c(k TEXT PRIMARY KEY, v BLOB, ts INTEGER)")
+        self.con.execute("CREATE INDEX IF NOT EXISTS c_ts ON c(ts)")
+        # One connection is shared by worker threads; sqlite3 needs callers to serialize
+        self.lock = threading.Lock()
+
+    def get(self, k: str) -> Optional[bytes]:
+        with self.lock:
+            row = self.con.execute(
+                "SELECT v FROM c WHERE k = ? AND ts >= ?", (k, int(time.time()) - self.ttl)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, k: str, v: bytes) -> None:
+        now = int(time.time())
+        with self.lock, self.con:
+            self.con.execute("INSERT OR REPLACE INTO c(k, v, ts) VALUES (?, ?, ?)", (k, v, now))
+            # Purge expired entries as we go so the file doesn't grow without bound (cheap with the ts index)
+            self.con.execute("DELETE FROM c WHERE ts < ?", (now - self.ttl,))
+
+    def close(self) -> None:
+        with self.lock:
+            self.con.close()
+
+def get_redis():
+    """Return the shared Redis client, or None if caching is not configured"""
+    global _redis
+    redis_url = os.getenv('REDIS_URL')
+    if _redis is None and aioredis is not None and redis_url:
+        _redis = aioredis.from_url(redis_url)
+        logger.info("LLM response cache enabled")
+    return _redis
+
+def get_local_cache() -> Optional[LLMCache]:
+    """Return the shared SQLite cache, or None if LLM_CACHE_DB is not set"""
+    global _local
+    if _local is None and LLM_CACHE_DB:
+        _local = LLMCache(LLM_CACHE_DB)
+        logger.info(f"SQLite LLM response cache enabled: {LLM_CACHE_DB}")
+    return _local
+
+async def close():
+    """Close the shared Redis client and SQLite cache"""
+    global _redis, _local
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+    if _local is not None:
+        _local.close()
+        _local = None
+
+def cache_key(model: str, prompt: str, content: str) -> str:
+    """Exact-match key for an extraction request"""
+    payload = orjson.dumps({"m": model, "p": prompt, "c": content}, option=orjson.OPT_SORT_KEYS)
+    return "llm:" + hashlib.sha256(payload).hexdigest()
+
+async def cached_call_llm(call_llm, client, model: str, prompt: str, content: str) -> Dict[str, Any]:
+    """Call `call_llm` in a worker thread, serving identical (model, prompt, content) requests from Redis or SQLite"""
+    cache = get_redis()
+    local = get_local_cache() if cache is None else None
+    if cache is None and local is None:
+        return await asyncio.to_thread(call_llm, client, model, prompt, content)
+
+    key = cache_key(model, prompt, content)
+    try:
+        hit = await cache.get(key) if cache is not None else await asyncio.to_thread(local.get, key)
+        if hit is not None:
+            logger.info(f"LLM cache hit: {key}")
+            return orjson.loads(hit)
+    except CACHE_ERRORS as e:
+        logger.warning(f"LLM cache lookup failed: {e}")
+
+    result = await asyncio.to_thread(call_llm, client, model, prompt, content)
+
+    # Don't pin parse failures in the cache; a retry may succeed
+    if result and "error" not in result:
+        try:
+            if cache is not None:
+                await cache.setex(key, LLM_CACHE_TTL, orjson.dumps(result))
+            else:
+                await asyncio.to_thread(local.set, key, orjson.dumps(result))
+        except CACHE_ERRORS as e:
+            logger.warning(f"LLM cache store failed: {e}")
+    return result
+
+# Seconds a cached Firecrawl scrape stays valid
+SCRAPE_CACHE_TTL = int(os.getenv('SCRAPE_CACHE_TTL', '1800'))
+
+def scrape_key(url: str) -> str:
+    """Cache key for a scraped URL"""
+    return "fc:" + hashlib.sha1(url.strip().encode()).hexdigest()
+
+async def get_scrape(url: str) -> Optional[str]:
+    """Return cached Firecrawl markdown for `url`, if any"""
+    cache = get_redis()
+    if cache is None:
+        return None
+    try:
+        hit = await cache.get(scrape_key(url))
+        return hit.decode() if hit is not None else None
+    except RedisError as e:
+        logger.warning(f"Scrape cache lookup failed: {e}")
+        return None
+
+async def put_scrape(url: str, markdown: str) -> None:
+    """Cache Firecrawl markdown for `url`"""
+    cache = get_redis()
+    if cache is None:
+        return
+    try:
+        await cache.setex(scrape_key(url), SCRAPE_CACHE_TTL, markdown)
+    except RedisError as e:
+        logger.warning(f"Scrape cache store failed: {e}")
@@ -1,17 +1,23 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Set, Tuple, Callable, AsyncIterator
 import json
 import tempfile
 import os
 import re
 import asyncio
 import logging
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from pathlib import Path
 import sys
 import httpx
-from database import supabase_client
+import orjson
+from database import get_supabase_client
+import llm_cache
 
 # Configure logging
 logging.basicConfig(
@@ -31,6 +37,8 @@ try:
         get_client, 
         get_model, 
         call_llm, 
+        call_llm_stream,
+        parse_llm_output,
         normalize_result
     )
     logger.info("Successfully imported extraction functions")
@@ -38,19 +46,54 @@ except Exception as e:
     logger.error(f"Failed to import extraction functions: {e}")
     raise
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Prompt, OpenAI client and model are fixed for the life of the process
+    app.state.system_prompt = read_prompt(None)
+    app.state.openai_client = get_client()
+    app.state.model = get_model(None)
+    logger.info(f"System prompt loaded (length: {len(app.state.system_prompt)}), model: {app.state.model}")
+    
+    # Shared HTTP client for outbound calls (Firecrawl) so connections are reused
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=70.0,
+        limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=30)
+    )
+    supabase_client = get_supabase_client()
+    await supabase_client.start()
+    await supabase_client.check_connection()
+    try:
+        yield
+    finally:
+        await supabase_client.aclose()
+        await app.state.http.aclose()
+        await llm_cache.close()
+
 app = FastAPI(
     title="Hotel Quote Parser Microservice",
     description="Extract structured hotel quote data from PDFs, HTML, and text",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
-# Add CORS middleware
+# Browser origins allowed to call the API (comma-separated); the Next.js
+# frontend calls it server-side, so this only matters for direct browser use
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000').split(',')
+    if origin.strip()
+]
+
+# Add CORS middleware; browsers cache preflight results for max_age seconds
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
+    max_age=86400,
 )
 
 class ExtractionResponse(BaseModel):
@@ -60,34 +103,119 @@ class ExtractionResponse(BaseModel):
     sources: List[str] = []
     urls_found: List[str] = []
 
-# URL detection patterns for proposal/quote links
-URL_PATTERNS = [
-    r'https?://[^\s]+proposal[^\s]*',
-    r'https?://[^\s]+quote[^\s]*', 
-    r'https?://[^\s]+booking[^\s]*',
-    r'https?://[^\s]+estimate[^\s]*',
-    r'https?://[^\s]+event[^\s]*',
-    r'https?://[^\s]+meeting[^\s]*',
-    r'https?://[^\s]+bookmarriott[^\s]*',  # Marriott specific
-    r'https?://[^\s]+marriott[^\s]*',      # Marriott specific
-    r'https?://[^\s]+view/[^\s]*',         # Generic view URLs
-    r'https?://[^\s]+proposals/[^\s]*'     # Generic proposals
-]
+# Keywords that mark a proposal/quote link
+URL_KEYWORDS = (
+    "proposal",
+    "quote",
+    "booking",
+    "estimate",
+    "event",
+    "meeting",
+    "bookmarriott",  # Marriott specific
+    "marriott",      # Marriott specific
+    "view/",         # Generic view URLs
+    "proposals/"     # Generic proposals
+)
+
+# URL detection pattern for proposal/quote links, compiled once as a single
+# alternation so extract_urls makes one pass over the text. It runs over
+# ASCII-lowered UTF-8 bytes, so it needs no IGNORECASE case folding. URLs also
+# end at <, > and " since uploaded HTML is scanned raw (href="...">, ...</p>).
+URL_RE = re.compile(
+    rb'https?://[^\s<>"]+(?:' + '|'.join(map(re.escape, URL_KEYWORDS)).encode() + rb')[^\s<>"]*'
+)
+
+# Whitespace a bytes pattern's \s doesn't cover (NBSP, U+3000, ...); mapped to a
+# plain space before encoding so it still ends a URL
+_NON_ASCII_WS_RE = re.compile(r'[^\S \t\n\r\f\v]')
+
+# Maximum number of Firecrawl scrapes run at once for a single request
+URL_SCRAPE_CONCURRENCY = 5
+
+# Receives (source, delta) for LLM output as it streams; set per request by /extract?stream=1
+_llm_delta_sink: ContextVar[Optional[Callable[[str, str], None]]] = ContextVar('llm_delta_sink', default=None)
+
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Path prefix of uploads saved as anonymous O_TMPFILE inodes; closing the fd frees them
+PROC_FD_PREFIX = "/proc/self/fd/"
+
+# Upload types whose raw bytes are also scanned for URLs
+TEXT_UPLOAD_TYPES = ('text/html', 'text/plain')
+
+# Texts at least this long are scanned with Hyperscan when it is installed
+HYPERSCAN_MIN_CHARS = 10_000
+
+# Optional Hyperscan database matching the URL keywords in one SIMD pass.
+# Scratch space is per thread since Hyperscan scratch is not shareable.
+try:
+    import hyperscan
+    _url_hs_db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+    _url_hs_db.compile(
+        expressions=[k.encode() for k in URL_KEYWORDS],
+        ids=list(range(len(URL_KEYWORDS))),
+        elements=len(URL_KEYWORDS),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SOM_LEFTMOST] * len(URL_KEYWORDS)
+    )
+    _url_hs_local = threading.local()
+    logger.info("Hyperscan available for URL extraction")
+except Exception:
+    _url_hs_db = None
+
+_ASCII_WS = frozenset(b' \t\n\r\f\v')
+
+def _urls_from_keyword_hits(data: bytes, hits: List[int]) -> Set[str]:
+    """Run URL_RE over each whitespace-delimited token that holds a keyword hit."""
+    urls = set()
+    lowered = data.lower()
+    token_end = -1
+    for start in sorted(hits):
+        # The token around this hit was already scanned in full
+        if start < token_end:
+            continue
+        token_start = start
+        while token_start > 0 and data[token_start - 1] not in _ASCII_WS:
+            token_start -= 1
+        token_end = start
+        while token_end < len(data) and data[token_end] not in _ASCII_WS:
+            token_end += 1
+        for m in URL_RE.finditer(lowered, token_start, token_end):
+            urls.add(data[m.start():m.end()].decode('utf-8', errors='replace'))
+    return urls
+
+def _extract_urls_hyperscan(text: str) -> Set[str]:
+    """Find URL keyword hits with Hyperscan and expand them to full URLs."""
+    scratch = getattr(_url_hs_local, 'scratch', None)
+    if scratch is None:
+        scratch = _url_hs_local.scratch = hyperscan.Scratch(_url_hs_db)
+    
+    hits = []
+    def on_match(pattern_id, start, end, flags, context):
+        hits.append(start)
+    
+    data = text.encode('utf-8')
+    _url_hs_db.scan(data, match_event_handler=on_match, scratch=scratch)
+    return _urls_from_keyword_hits(data, hits)
 
-def extract_urls(text: str) -> List[str]:
-    """Extract URLs from text using regex patterns."""
-    logger.info(f"Extracting URLs from text (length: {len(text)})")
-    urls = []
-    for pattern in URL_PATTERNS:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        if matches:
-            logger.info(f"Found {len(matches)} URLs with pattern {pattern}: {matches}")
-        urls.extend(matches)
-    unique_urls = list(set(urls))
-    logger.info(f"Total unique URLs found: {len(unique_urls)}")
+def extract_urls(text: str) -> Set[str]:
+    """Extract unique URLs from text using the proposal/quote URL pattern."""
+    logger.debug("Extracting URLs from text (length: %s)", len(text))
+    text = _NON_ASCII_WS_RE.sub(' ', text)
+    if _url_hs_db is not None and len(text) >= HYPERSCAN_MIN_CHARS:
+        unique_urls = _extract_urls_hyperscan(text)
+    else:
+        # bytes.lower() only touches ASCII letters, so offsets in the lowered copy
+        # line up with the original and URLs keep their case
+        data = text.encode('utf-8')
+        unique_urls = {
+            data[m.start():m.end()].decode('utf-8', errors='replace')
+            for m in URL_RE.finditer(data.lower())
+        }
+    logger.debug("Total unique URLs found: %s", len(unique_urls))
     return unique_urls
 
-async def call_firecrawl_scrape(url: str) -> Optional[str]:
+async def call_firecrawl_scrape(url: str, client: httpx.AsyncClient) -> Optional[str]:
     """Call Firecrawl scrape API to get clean markdown from a URL"""
     logger.info(f"Attempting Firecrawl scrape for URL: {url}")
     
@@ -97,32 +225,36 @@ async def call_firecrawl_scrape(url: str) -> Optional[str]:
         logger.warning("FIRECRAWL_API_KEY not found in environment")
         return None
     
+    cached = await llm_cache.get_scrape(url)
+    if cached is not None:
+        logger.info(f"Using cached Firecrawl markdown for URL: {url}")
+        return cached
+    
     try:
-        async with httpx.AsyncClient() as client:
-            # Call Firecrawl scrape endpoint
-            response = await client.post(
-                "https://api.firecrawl.dev/v1/scrape",
-                headers={
-                    "Authorization": f"Bearer {firecrawl_api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "url": url,
-                    "formats": ["markdown"],
-                    "onlyMainContent": True,
-                    "timeout": 60000  # 60 seconds
-                },
-                timeout=70.0
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('success') and result.get('data', {}).get('markdown'):
-                    markdown_content = result['data']['markdown']
-                    logger.info(f"Successfully scraped {len(markdown_content)} characters of markdown")
-                    logger.info(f"Markdown preview (first 500 chars): {markdown_content[:500]}")
-                    
-                    # Save the full markdown to a file for debugging
+        # Call Firecrawl scrape endpoint
+        response = await client.post(
+            "https://api.firecrawl.dev/v1/scrape",
+            headers={
+                "Authorization": f"Bearer {firecrawl_api_key}",
+                "Content-Type": "application/json"
+            },
+            json={
+                "url": url,
+                "formats": ["markdown"],
+                "onlyMainContent": True,
+                "timeout": 60000  # 60 seconds
+            }
+        )
+        
+        if response.status_code == 200:
+            result = orjson.loads(response.content)
+            if result.get('success') and result.get('data', {}).get('markdown'):
+                markdown_content = result['data']['markdown']
+                logger.info(f"Successfully scraped {len(markdown_content)} characters of markdown")
+                
+                # Log a preview and save the full markdown to a file for debugging
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Markdown preview (first 500 chars): %s", markdown_content[:500])
                     debug_file = f"/tmp/firecrawl_debug_{url.split('/')[-1]}.md"
                     try:
                         with open(debug_file, 'w', encoding='utf-8') as f:
@@ -130,120 +262,142 @@ async def call_firecrawl_scrape(url: str) -> Optional[str]:
                             f.write(f"URL: {url}\n")
                             f.write(f"Length: {len(markdown_content)} characters\n\n")
                             f.write(markdown_content)
-                        logger.info(f"Full markdown saved to: {debug_file}")
+                        logger.debug(f"Full markdown saved to: {debug_file}")
                     except Exception as e:
                         logger.warning(f"Could not save debug file: {e}")
-                    
-                    return markdown_content
-                else:
-                    logger.error(f"Firecrawl scrape failed: {result}")
-                    return None
+                
+                await llm_cache.put_scrape(url, markdown_content)
+                return markdown_content
             else:
-                logger.error(f"Firecrawl scrape failed with status {response.status_code}: {response.text}")
+                logger.error(f"Firecrawl scrape failed: {result}")
                 return None
-                
+        else:
+            logger.error(f"Firecrawl scrape failed with status {response.status_code}: {response.text}")
+            return None
+            
     except Exception as e:
         logger.error(f"Firecrawl scrape failed: {e}")
         return None
 
+def _llm_caller(source: str) -> Callable[..., Dict[str, Any]]:
+    """Return call_llm, or a streaming drop-in that reports deltas when the request streams."""
+    on_delta = _llm_delta_sink.get()
+    if on_delta is None:
+        return call_llm
+    
+    def stream_call_llm(client, model: str, system_prompt: str, content: str) -> Dict[str, Any]:
+        parts = []
+        for delta in call_llm_stream(client, model, system_prompt, content):
+            parts.append(delta)
+            on_delta(source, delta)
+        return parse_llm_output("".join(parts))
+    return stream_call_llm
+
 async def process_text_content(content: str, source_type: str) -> Dict[str, Any]:
     """Process text content using the LLM extraction logic."""
     try:
-        logger.info(f"Processing {source_type} content (length: {len(content)})")
+        logger.debug("Processing %s content (length: %s)", source_type, len(content))
         
-        # Get the system prompt
-        logger.info("Reading system prompt...")
-        system_prompt = read_prompt(None)
-        logger.info(f"System prompt loaded (length: {len(system_prompt)})")
-        
-        # Get OpenAI client
-        logger.info("Initializing OpenAI client...")
-        client = get_client()
-        model = get_model(None)
-        logger.info(f"Using model: {model}")
+        # Prompt, client and model are loaded once at startup
+        system_prompt = app.state.system_prompt
+        model = app.state.model
+        logger.debug("Using model: %s", model)
         
         # Call the LLM
-        logger.info("Calling OpenAI API...")
-        result = call_llm(client, model, system_prompt, content)
-        logger.info("OpenAI API call completed successfully")
+        logger.debug("Calling OpenAI API...")
+        result = await llm_cache.cached_call_llm(_llm_caller(source_type), app.state.openai_client, model, system_prompt, content)
+        logger.debug("OpenAI API call completed successfully")
         
         # Add source metadata
         result["source"] = source_type
         result["content_length"] = len(content)
         
-        logger.info(f"Text processing completed for {source_type}")
+        logger.debug("Text processing completed for %s", source_type)
         return result
         
     except Exception as e:
         logger.error(f"Failed to process {source_type} content: {str(e)}")
         raise Exception(f"Failed to process {source_type} content: {str(e)}")
 
-async def process_uploaded_file(file: UploadFile) -> Dict[str, Any]:
-    """Process uploaded file (PDF/HTML) using the extraction logic."""
+def _open_upload_file(suffix: str) -> Tuple[int, str]:
+    """Open a temp file for an upload, preferring an anonymous O_TMPFILE inode on Linux."""
+    if hasattr(os, 'O_TMPFILE'):
+        try:
+            fd = os.open(tempfile.gettempdir(), os.O_TMPFILE | os.O_RDWR, 0o600)
+            return fd, f"{PROC_FD_PREFIX}{fd}"
+        except OSError:
+            pass  # Filesystem without O_TMPFILE support
+    return tempfile.mkstemp(suffix=suffix)
+
+async def save_upload(file: UploadFile) -> Tuple[str, int, Optional[bytes]]:
+    """Stream an upload to a temp file; returns (path, size, raw bytes for text uploads)."""
+    keep_raw = file.content_type in TEXT_UPLOAD_TYPES
+    raw = bytearray()
+    total = 0
+    fd, tmp_file_path = _open_upload_file(Path(file.filename).suffix)
     try:
-        logger.info(f"Processing uploaded file: {file.filename} (type: {file.content_type}, size: {file.size})")
+        # An anonymous inode only lives as long as its fd, so keep that open until cleanup
+        with os.fdopen(fd, 'wb', closefd=not tmp_file_path.startswith(PROC_FD_PREFIX)) as tmp_file:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                tmp_file.write(chunk)
+                total += len(chunk)
+                if keep_raw:
+                    raw += chunk
+    except BaseException:
+        remove_temp_files([tmp_file_path])
+        raise
+    logger.info(f"Saved {total} bytes from {file.filename} to {tmp_file_path}")
+    return tmp_file_path, total, bytes(raw) if keep_raw else None
+
+async def process_uploaded_file(file: UploadFile, tmp_file_path: str, file_size: int) -> Dict[str, Any]:
+    """Process an uploaded file (PDF/HTML) already saved to `tmp_file_path`."""
+    try:
+        logger.info(f"Processing uploaded file: {file.filename} (type: {file.content_type}, size: {file_size})")
         
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as tmp_file:
-            content = await file.read()
-            logger.info(f"Read {len(content)} bytes from uploaded file")
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
-            logger.info(f"Created temporary file: {tmp_file_path}")
+        # Extract text using the existing logic; parsing is blocking, so keep it off the event loop
+        logger.debug("Extracting text from file...")
+        extracted_text = await asyncio.to_thread(extract_text, tmp_file_path, Path(file.filename).suffix)
+        logger.debug("Extracted text (length: %s)", len(extracted_text))
         
-        try:
-            # Extract text using the existing logic
-            logger.info("Extracting text from file...")
-            extracted_text = extract_text(tmp_file_path)
-            logger.info(f"Extracted text (length: {len(extracted_text)})")
-            
-            # Process the extracted text
-            result = await process_text_content(extracted_text, "file")
-            result["filename"] = file.filename
-            result["file_size"] = len(content)
-            
-            logger.info(f"File processing completed successfully")
-            return result
-            
-        finally:
-            # Clean up temp file
-            os.unlink(tmp_file_path)
-            logger.info(f"Cleaned up temporary file: {tmp_file_path}")
+        # Process the extracted text
+        result = await process_text_content(extracted_text, "file")
+        result["filename"] = file.filename
+        result["file_size"] = file_size
+        
+        logger.debug("File processing completed successfully")
+        return result
             
     except Exception as e:
         logger.error(f"Failed to process uploaded file: {str(e)}")
         raise Exception(f"Failed to process uploaded file: {str(e)}")
 
-async def process_url_content(url: str) -> Dict[str, Any]:
+async def process_url_content(url: str, client: httpx.AsyncClient) -> Dict[str, Any]:
     """Process content from URL using Firecrawl scrape + LLM."""
     try:
         logger.info(f"Processing URL content: {url}")
         
         # Call Firecrawl to scrape markdown
-        markdown_content = await call_firecrawl_scrape(url)
+        markdown_content = await call_firecrawl_scrape(url, client)
         if markdown_content:
-            logger.info("Firecrawl scrape successful, processing with LLM...")
+            logger.debug("Firecrawl scrape successful, processing with LLM...")
             
             # Process the markdown content with our existing LLM prompt
             try:
-                # Read the system prompt
-                system_prompt = read_prompt(None)
-                logger.info(f"System prompt loaded (length: {len(system_prompt)})")
-                
-                # Initialize OpenAI client
-                client = get_client()
-                model = get_model(None)  # Pass None for cli argument
-                logger.info(f"Using model: {model}")
+                # Prompt, client and model are loaded once at startup
+                system_prompt = app.state.system_prompt
+                model = app.state.model
+                logger.debug("Using model: %s", model)
                 
                 # Call OpenAI API with the markdown content
-                logger.info("Calling OpenAI API with scraped markdown...")
-                logger.info(f"Markdown content length: {len(markdown_content)}")
-                logger.info(f"System prompt length: {len(system_prompt)}")
+                logger.debug("Calling OpenAI API with scraped markdown...")
+                logger.debug("Markdown content length: %s", len(markdown_content))
+                logger.debug("System prompt length: %s", len(system_prompt))
                 
                 # Log a sample of the markdown content to see what we're processing
-                logger.info(f"Markdown sample (first 1000 chars): {markdown_content[:1000]}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Markdown sample (first 1000 chars): %s", markdown_content[:1000])
                 
-                llm_result = call_llm(client, model, system_prompt, markdown_content)
+                llm_result = await llm_cache.cached_call_llm(_llm_caller("url"), app.state.openai_client, model, system_prompt, markdown_content)
                 
                 if llm_result:
                     # Normalize the result
@@ -266,9 +420,44 @@ async def process_url_content(url: str) -> Dict[str, Any]:
         logger.error(f"Failed to process URL {url}: {str(e)}")
         raise Exception(f"Failed to process URL {url}: {str(e)}")
 
+async def scrape_url_guarded(
+    url: str,
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """Process a URL under the scrape semaphore, returning (url, data) with data None on failure."""
+    async with sem:
+        try:
+            return url, await process_url_content(url, client)
+        except Exception as e:
+            logger.warning(f"Failed to process URL {url}: {e}")
+            return url, None
+
+async def scrape_first_url(urls: List[str], client: httpx.AsyncClient) -> Optional[Dict[str, Any]]:
+    """Scrape URLs concurrently and return the first successful result, cancelling the rest."""
+    logger.info("Attempting to process URLs with Firecrawl...")
+    sem = asyncio.Semaphore(URL_SCRAPE_CONCURRENCY)
+    tasks = [asyncio.create_task(scrape_url_guarded(url, client, sem)) for url in urls]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            url, url_data = await next_done
+            if url_data:
+                logger.info(f"Successfully processed URL: {url}")
+                return url_data  # Use first successful URL
+        return None
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def _concession_key(concession: Any) -> Any:
+    """Hashable identity for a concession, which may be a string or a dict."""
+    if isinstance(concession, dict):
+        return orjson.dumps(concession, option=orjson.OPT_SORT_KEYS)
+    return concession
+
 def merge_extraction_results(extracted_data: Dict[str, Any]) -> Dict[str, Any]:
     """Merge extraction results using precedence rules."""
-    logger.info(f"Merging extraction results from sources: {list(extracted_data.keys())}")
+    logger.debug("Merging extraction results from sources: %s", list(extracted_data.keys()))
     
     if "proposal" in extracted_data and "email" in extracted_data:
         # Merge proposal and email data
@@ -283,18 +472,24 @@ def merge_extraction_results(extracted_data: Dict[str, Any]) -> Dict[str, Any]:
             totals = merged["totals"]
             extras = merged.get("extras", {})
             
+            # Bind the nested totals once; the in-place fixes below write through to them
+            guestroom_total = totals.get("guestroom_total") or {}
+            fnb_total = totals.get("fnb_total") or {}
+            total_quote_entry = totals.get("total_quote") or {}
+            
             # Fix guestroom total
-            if totals.get("guestroom_total", {}).get("amount") == 0 and extras.get("guestroom_base"):
+            if guestroom_total.get("amount") == 0 and extras.get("guestroom_base"):
                 guestroom_base = extras["guestroom_base"]
                 guestroom_taxes = extras.get("guestroom_taxes_fees", 0)
-                totals["guestroom_total"]["amount"] = guestroom_base + guestroom_taxes
-                logger.info(f"Fixed guestroom total: {totals['guestroom_total']['amount']}")
+                guestroom_total["amount"] = guestroom_base + guestroom_taxes
+                logger.debug("Fixed guestroom total: %s", guestroom_total["amount"])
             
             # Fix F&B total
-            if totals.get("fnb_total", {}).get("amount") == 0 and extras.get("estimated_fnb_gross"):
-                totals["fnb_total"]["amount"] = extras["estimated_fnb_gross"]
-                logger.info(f"Fixed F&B total: {totals['fnb_total']['amount']}")
-            elif totals.get("fnb_total", {}).get("amount") == 0 and extras.get("fnb_minimum"):
+            fnb_amount = fnb_total.get("amount")
+            if fnb_amount == 0 and extras.get("estimated_fnb_gross"):
+                fnb_total["amount"] = extras["estimated_fnb_gross"]
+                logger.debug("Fixed F&B total: %s", fnb_total["amount"])
+            elif fnb_amount == 0 and extras.get("fnb_minimum"):
                 # Calculate F&B gross if we have the minimum and rates
                 fnb_min = extras["fnb_minimum"]
                 service_rate = extras.get("service_rate_pct", 0)
@@ -306,18 +501,18 @@ def merge_extraction_results(extracted_data: Dict[str, Any]) -> Dict[str, Any]:
                     tax_on_fnb = fnb_min * (tax_rate / 100)
                     estimated_gross = fnb_min + service_charge + tax_on_service + tax_on_fnb
                     
-                    totals["fnb_total"]["amount"] = estimated_gross
+                    fnb_total["amount"] = estimated_gross
                     extras["estimated_fnb_gross"] = estimated_gross
-                    logger.info(f"Calculated F&B total: {estimated_gross}")
+                    logger.debug("Calculated F&B total: %s", estimated_gross)
             
             # Fix total quote
-            if totals.get("total_quote", {}).get("amount") == 0:
-                guestroom = totals.get("guestroom_total", {}).get("amount", 0)
-                meeting = totals.get("meeting_room_total", {}).get("amount", 0)
-                fnb = totals.get("fnb_total", {}).get("amount", 0)
+            if total_quote_entry.get("amount") == 0:
+                guestroom = guestroom_total.get("amount", 0)
+                meeting = (totals.get("meeting_room_total") or {}).get("amount", 0)
+                fnb = fnb_total.get("amount", 0)
                 total_quote = guestroom + meeting + fnb
-                totals["total_quote"]["amount"] = total_quote
-                logger.info(f"Calculated total quote: {total_quote}")
+                total_quote_entry["amount"] = total_quote
+                logger.debug("Calculated total quote: %s", total_quote)
         
         # Fill gaps from email data
         if not merged.get("property") and email.get("property"):
@@ -326,27 +521,29 @@ def merge_extraction_results(extracted_data: Dict[str, Any]) -> Dict[str, Any]:
         if not merged.get("program") and email.get("program"):
             merged["program"] = email["program"]
         
-        # Merge concessions
-        proposal_concessions = merged.get("concessions", [])
-        email_concessions = email.get("concessions", [])
-        merged["concessions"] = list(set(proposal_concessions + email_concessions))
+        # Merge concessions, dropping duplicates but keeping proposal order first
+        proposal_concessions = merged.get("concessions") or []
+        email_concessions = email.get("concessions") or []
+        merged["concessions"] = list({
+            _concession_key(c): c for c in proposal_concessions + email_concessions
+        }.values())
         
         # Add source metadata
         merged["sources"] = ["proposal", "email"]
         
-        logger.info("Successfully merged proposal and email data")
+        logger.debug("Successfully merged proposal and email data")
         return merged
         
     elif "proposal" in extracted_data:
         result = extracted_data["proposal"]
         result["sources"] = ["proposal"]
-        logger.info("Using proposal data only")
+        logger.debug("Using proposal data only")
         return result
         
     elif "email" in extracted_data:
         result = extracted_data["email"]
         result["sources"] = ["email"]
-        logger.info("Using email data only")
+        logger.debug("Using email data only")
         return result
         
     else:
@@ -363,12 +560,36 @@ async def health_check():
     logger.info("Health check endpoint called")
     return {"status": "healthy", "service": "hotel-quote-parser"}
 
+def remove_temp_files(paths: List[str]) -> None:
+    """Remove uploads saved to disk, logging any that can't be removed."""
+    for tmp_file_path in paths:
+        try:
+            if tmp_file_path.startswith(PROC_FD_PREFIX):
+                os.close(int(tmp_file_path[len(PROC_FD_PREFIX):]))
+            else:
+                os.unlink(tmp_file_path)
+        except OSError as e:
+            logger.warning(f"Failed to remove temporary file {tmp_file_path}: {e}")
+
+def failed_response(e: Exception) -> ExtractionResponse:
+    """Log an extraction failure and build the error response."""
+    logger.error(f"=== Extraction process failed: {str(e)} ===")
+    return ExtractionResponse(
+        success=False,
+        error=str(e),
+        sources=[],
+        urls_found=[]
+    )
+
 @app.post("/extract", response_model=ExtractionResponse)
 async def extract_quote(
+    request: Request,
+    background_tasks: BackgroundTasks,
     email_content: Optional[str] = Form(None),
     email_file: Optional[UploadFile] = File(None),
     proposal_file: Optional[UploadFile] = File(None),
-    proposal_url: Optional[str] = Form(None)
+    proposal_url: Optional[str] = Form(None),
+    stream: bool = False
 ):
     """
     Extract hotel quote data from multiple sources.
@@ -379,6 +600,9 @@ async def extract_quote(
     3. Extract URLs from content
     4. Try Firecrawl for URLs, fallback to GPT
     5. Merge results with precedence rules
+    
+    With ?stream=1 the response is NDJSON: "delta" events carry LLM output as it
+    is generated, followed by a "final" event holding the ExtractionResponse.
     """
     logger.info("=== Starting extraction process ===")
     logger.info(f"Received request with:")
@@ -387,59 +611,115 @@ async def extract_quote(
     logger.info(f"  - proposal_file: {proposal_file.filename if proposal_file else 'No'}")
     logger.info(f"  - proposal_url: {proposal_url if proposal_url else 'No'}")
     
+    # Save uploads before responding; a streamed response outlives the request's upload files
+    tmp_paths = []
+    saved_files = {}
+    file_urls: Set[str] = set()
+    try:
+        # Stream each upload to disk once; text uploads also keep their bytes for URL extraction
+        for key, upload in (("email", email_file), ("proposal", proposal_file)):
+            if upload:
+                tmp_file_path, file_size, raw = await save_upload(upload)
+                tmp_paths.append(tmp_file_path)
+                saved_files[key] = (tmp_file_path, file_size)
+                if raw is not None:
+                    file_urls.update(extract_urls(raw.decode('utf-8', errors='replace')))
+    except Exception as e:
+        remove_temp_files(tmp_paths)
+        return failed_response(e)
+    
+    extraction = run_extraction(
+        request.app.state.http, background_tasks, email_content, email_file,
+        proposal_file, proposal_url, saved_files, file_urls
+    )
+    if stream:
+        return StreamingResponse(stream_extraction(extraction, tmp_paths), media_type="application/x-ndjson")
+    try:
+        return await extraction
+    finally:
+        remove_temp_files(tmp_paths)
+
+async def stream_extraction(extraction, tmp_paths: List[str]) -> AsyncIterator[bytes]:
+    """Run `extraction`, yielding NDJSON delta events as the LLM streams and then the final response."""
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    
+    def on_delta(source: str, delta: str) -> None:
+        # Called from the LLM worker thread
+        loop.call_soon_threadsafe(events.put_nowait, {"type": "delta", "source": source, "delta": delta})
+    
+    # The task copies the context, so its LLM calls see the sink
+    token = _llm_delta_sink.set(on_delta)
+    task = asyncio.create_task(extraction)
+    _llm_delta_sink.reset(token)
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    try:
+        while (event := await events.get()) is not None:
+            yield orjson.dumps(event) + b"\n"
+        yield orjson.dumps({"type": "final", "data": task.result().model_dump()}) + b"\n"
+    finally:
+        task.cancel()
+        remove_temp_files(tmp_paths)
+
+async def run_extraction(
+    http_client: httpx.AsyncClient,
+    background_tasks: BackgroundTasks,
+    email_content: Optional[str],
+    email_file: Optional[UploadFile],
+    proposal_file: Optional[UploadFile],
+    proposal_url: Optional[str],
+    saved_files: Dict[str, Tuple[str, int]],
+    file_urls: Set[str]
+) -> ExtractionResponse:
+    """Run the extraction branches for a request whose uploads are already saved to disk."""
     try:
         sources = []
         extracted_data = {}
-        all_urls = []
+        all_urls: Set[str] = set(file_urls)
         
-        # Process email content if provided
+        # Extract URLs up front so the URL scrape can run alongside the other branches
         if email_content:
-            logger.info("Processing email content...")
-            sources.append("email")
-            email_data = await process_text_content(email_content, "email")
-            extracted_data["email"] = email_data
-            
-            # Extract URLs from email content
-            email_urls = extract_urls(email_content)
-            all_urls.extend(email_urls)
+            all_urls.update(extract_urls(email_content))
+        
+        # Process proposal URL if provided directly
+        if proposal_url:
+            all_urls.add(proposal_url)
         
-        # Process email file if provided
+        # The set already holds each URL once; the API returns a list
+        unique_urls = list(all_urls)
+        logger.debug("All URLs found: %s", unique_urls)
+        
+        # Email, files and URL scrape are independent, so run them concurrently
+        branches = []
+        if email_content:
+            logger.debug("Processing email content...")
+            sources.append("email")
+            branches.append(("email", process_text_content(email_content, "email")))
         if email_file:
-            logger.info("Processing email file...")
+            logger.debug("Processing email file...")
             sources.append("email_file")
-            email_data = await process_uploaded_file(email_file)
-            extracted_data["email"] = email_data
-            
-            # Extract URLs from email file content if it's text-based
-            if email_file.content_type in ['text/html', 'text/plain']:
-                file_content = await email_file.read()
-                file_text = file_content.decode('utf-8')
-                file_urls = extract_urls(file_text)
-                all_urls.extend(file_urls)
-        
-        # Process proposal file if provided
+            branches.append(("email", process_uploaded_file(email_file, *saved_files["email"])))
         if proposal_file:
-            logger.info("Processing proposal file...")
+            logger.debug("Processing proposal file...")
             sources.append("proposal_file")
-            proposal_data = await process_uploaded_file(proposal_file)
-            extracted_data["proposal"] = proposal_data
-            
-            # Extract URLs from proposal content if it's text-based
-            if proposal_file.content_type in ['text/html', 'text/plain']:
-                file_content = await proposal_file.read()
-                file_text = file_content.decode('utf-8')
-                file_urls = extract_urls(file_text)
-                all_urls.extend(file_urls)
-        
-        # Process proposal URL if provided directly
+            branches.append(("proposal", process_uploaded_file(proposal_file, *saved_files["proposal"])))
         if proposal_url:
-            logger.info("Processing proposal URL...")
+            logger.debug("Processing proposal URL...")
             sources.append("proposal_url")
-            all_urls.append(proposal_url)
+        if unique_urls:
+            branches.append(("url", scrape_first_url(unique_urls, http_client)))
+        
+        results = await asyncio.gather(*(coro for _, coro in branches), return_exceptions=True)
         
-        # Remove duplicate URLs
-        unique_urls = list(set(all_urls))
-        logger.info(f"All URLs found: {unique_urls}")
+        # Apply in branch order so later sources take precedence as before
+        url_data = None
+        for (key, _), result in zip(branches, results):
+            if isinstance(result, BaseException):
+                raise result
+            if key == "url":
+                url_data = result
+            else:
+                extracted_data[key] = result
         
         # Check if we have any extracted data and look for URLs in the AI response
         if not unique_urls and extracted_data:
@@ -451,65 +731,52 @@ async def extract_quote(
                         url = source_data['extras']['proposal_url']
                         logger.info(f"Found URL in AI response: {url}")
                         unique_urls.append(url)
+                        url_data = await scrape_first_url(unique_urls, http_client)
                         break
         
-        # Try to process URLs with Firecrawl
-        if unique_urls:
-            logger.info("Attempting to process URLs with Firecrawl...")
-            for url in unique_urls:
-                try:
-                    url_data = await process_url_content(url)
-                    if url_data:
-                        extracted_data["proposal"] = url_data
-                        sources.append("proposal_url")
-                        logger.info(f"Successfully processed URL: {url}")
-                        break  # Use first successful URL
-                except Exception as e:
-                    logger.warning(f"Failed to process URL {url}: {e}")
-                    continue
+        if url_data:
+            extracted_data["proposal"] = url_data
+            sources.append("proposal_url")
         
         if not extracted_data:
             logger.error("No content provided for extraction")
             raise HTTPException(status_code=400, detail="No content provided for extraction")
         
         # Merge the data using precedence rules
-        logger.info("Merging extracted data...")
+        logger.debug("Merging extracted data...")
         merged_data = merge_extraction_results(extracted_data)
         
         # Store data in Supabase database
         try:
-            logger.info("Storing data in Supabase database...")
+            logger.debug("Storing data in Supabase database...")
             
-            # Store the main request
-            request_id = await supabase_client.store_hotel_quote_request(
-                email_content=email_content,
-                email_file_name=email_file.filename if email_file else None,
-                email_file_size=email_file.size if email_file else None,
-                proposal_file_name=proposal_file.filename if proposal_file else None,
-                proposal_file_size=proposal_file.size if proposal_file else None,
-                proposal_url=proposal_url,
-                urls_found=unique_urls,
-                sources_used=sources,
-                content_length=len(email_content) if email_content else 0,
-                firecrawl_scraped=len(unique_urls) > 0,
-                firecrawl_content_length=0  # We'll get this from the actual scrape if needed
+            # Queue the request with its quote, property and concession rows for background writing
+            supabase_client = get_supabase_client()
+            payload = dict(
+                request_data=dict(
+                    email_content=email_content,
+                    email_file_name=email_file.filename if email_file else None,
+                    email_file_size=email_file.size if email_file else None,
+                    proposal_file_name=proposal_file.filename if proposal_file else None,
+                    proposal_file_size=proposal_file.size if proposal_file else None,
+                    proposal_url=proposal_url,
+                    urls_found=unique_urls,
+                    sources_used=sources,
+                    content_length=len(email_content) if email_content else 0,
+                    firecrawl_scraped=len(unique_urls) > 0,
+                    firecrawl_content_length=0  # We'll get this from the actual scrape if needed
+                ),
+                quote_data=merged_data,
+                property_data=merged_data.get('property'),
+                concessions=merged_data.get('concessions')
             )
             
-            if request_id:
-                # Store the quote data
-                await supabase_client.store_hotel_quote_data(request_id, merged_data)
-                
-                # Store property info if available
-                if merged_data.get('property'):
-                    await supabase_client.store_property_info(request_id, merged_data['property'])
-                
-                # Store concessions if available
-                if merged_data.get('concessions'):
-                    await supabase_client.store_concessions(request_id, merged_data['concessions'])
-                
-                logger.info(f"Successfully stored all data in database with request ID: {request_id}")
-            else:
-                logger.warning("Failed to store data in database")
+            if supabase_client.enqueue_full_quote(payload):
+                logger.info("Queued data for database storage")
+            elif supabase_client.enabled:
+                # Write queue not running or full; store once the response has been sent
+                background_tasks.add_task(supabase_client.store_full_quote, **payload)
+                logger.info("Scheduled data for database storage after response")
                 
         except Exception as e:
             logger.error(f"Error storing data in database: {e}")
@@ -525,13 +792,7 @@ async def extract_quote(
         )
         
     except Exception as e:
-        logger.error(f"=== Extraction process failed: {str(e)} ===")
-        return ExtractionResponse(
-            success=False,
-            error=str(e),
-            sources=[],
-            urls_found=[]
-        )
+        return failed_response(e)
 
 @app.post("/extract-text")
 async def extract_from_text(content: str):
@@ -546,10 +807,10 @@ async def extract_from_text(content: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/recent-requests")
-async def get_recent_requests(limit: int = 10):
+async def get_recent_requests(limit: int = 10, offset: int = 0):
     """Get recent hotel quote requests from the database."""
     try:
-        requests = await supabase_client.get_recent_requests(limit)
+        requests = await get_supabase_client().get_recent_requests(limit, offset)
         return {"success": True, "data": requests}
     except Exception as e:
         logger.error(f"Failed to get recent requests: {e}")
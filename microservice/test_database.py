@@ -0,0 +1,59 @@
+"""
+Tests for Supabase row encoding (no network or credentials needed)
+"""
+
+import io
+import csv
+import orjson
+
+from database import SupabaseClient, CSV_BULK_THRESHOLD, _concession_rows
+
+def _stored_text(value):
+    """Text Postgres stores in a text column for a JSON value inserted through PostgREST"""
+    if value is None or isinstance(value, str):
+        return value
+    return orjson.dumps(value).decode()
+
+def _decode(headers, body):
+    """Decode a concessions insert body into the column values PostgREST would store"""
+    if headers.get("Content-Type") == "text/csv":
+        reader = csv.reader(io.StringIO(body.decode()))
+        columns = next(reader)
+        return [{c: None if v == "NULL" else v for c, v in zip(columns, row)} for row in reader]
+    return [{k: _stored_text(v) for k, v in row.items()} for row in orjson.loads(body)]
+
+def _concessions(n, text="Complimentary wifi"):
+    return [
+        text if i % 2 else {
+            "text": f"{text} {i}",
+            "type": None,
+            "value_impact": 1250.5,
+            "conditions": ["min 50 room nights", {"cutoff": "30 days", "waived": True}]
+        }
+        for i in range(n)
+    ]
+
+def test_csv_and_json_bodies_store_the_same_values():
+    """A bulk CSV insert stores exactly what the equivalent JSON inserts would"""
+    client = SupabaseClient()
+    rows = _concession_rows("req-1", _concessions(CSV_BULK_THRESHOLD + 1))
+    
+    csv_headers, csv_body = client._concession_body(rows)
+    assert csv_headers["Content-Type"] == "text/csv"
+    
+    json_rows = []
+    for row in rows:
+        headers, body = client._concession_body([row])
+        assert "Content-Type" not in headers
+        json_rows.extend(_decode(headers, body))
+    
+    assert _decode(csv_headers, csv_body) == json_rows
+
+def test_literal_null_text_is_not_sent_as_csv():
+    """Text that is literally NULL would become SQL null in CSV, so it goes as JSON"""
+    client = SupabaseClient()
+    rows = _concession_rows("req-1", _concessions(CSV_BULK_THRESHOLD + 1, text="NULL"))
+    
+    headers, body = client._concession_body(rows)
+    assert headers.get("Content-Type") != "text/csv"
+    assert _decode(headers, body)[1]["concession_text"] == "NULL"
@@ -6,11 +6,16 @@
 # - Handles: .pdf, .html/.htm, and plaintext (.txt) inputs; a single file or a directory
 # - Extracts text using:
 #     * unstructured (if installed) for PDFs
-#     * PyPDF2 fallback for PDFs
-#     * BeautifulSoup (if installed) or html2text-like fallback for HTML
+#     * pypdf (or PyPDF2) for PDFs
+#     * selectolax, lxml or BeautifulSoup (whichever is installed first) or html2text-like fallback for HTML
 # - Sends full text to the LLM with a hotel-quote-specific JSON schema prompt
 # - Saves JSON as <basename>.json in --out
-# - Retries with exponential backoff
+# - Retries with exponential backoff (handled by the OpenAI SDK)
+# - Multiplexes LLM requests over HTTP/2 when the h2 package is installed
+# - Processes up to HQP_CONCURRENCY files at once (default 12)
+# - --cache-dir reuses results for documents already extracted with the same model and prompt
+# - --pack-chars sends several small documents in one request
+# - --batch submits all files as one OpenAI Batch API job (half price, results within 24h)
 
 # Example:
 #     export OPENAI_API_KEY=...
@@ -19,59 +24,253 @@
 
 import os
 import re
+import mmap
 import json
+import asyncio
+import string
 import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import importlib
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from types import MappingProxyType
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 
-# Retry utilities
+import extraction_cache
+
+# Optional extraction backends, imported on first use; None when not installed.
+# Caching misses too means a missing package isn't searched for again on every file.
+_BACKENDS: Dict[str, Any] = {}
+
+def _backend(name: str):
+    if name not in _BACKENDS:
+        try:
+            _BACKENDS[name] = importlib.import_module(name)
+        except Exception:
+            _BACKENDS[name] = None
+    return _BACKENDS[name]
+
+# Fast JSON via orjson when installed
 try:
-    from tenacity import retry, wait_random_exponential, stop_after_attempt
-except Exception:
-    def retry(*a, **k):
-        def deco(fn): return fn
-        return deco
-    def wait_random_exponential(*a, **k): return None
-    def stop_after_attempt(*a, **k): return None
+    import orjson
+    def _loads(s): return orjson.loads(s)
+    def _dumps(obj, indent: bool = False) -> bytes:
+        return orjson.dumps(obj, option=(orjson.OPT_INDENT_2 if indent else 0) | orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    def _loads(s): return json.loads(s)
+    def _dumps(obj, indent: bool = False) -> bytes:
+        return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode("utf-8")
+
+# Patterns used on every file, compiled once
+_RE_BLANKS = re.compile(r"\n{2,}")
+_RE_SCRIPT_STYLE = re.compile(r"<(script|style)[\s\S]*?</\1>", re.I)
+_RE_TAG = re.compile(r"<[^>]+>")
+_RE_WS = re.compile(r"\s+")
+_RE_JSON_TAIL = re.compile(r"\{[\s\S]*\}\s*$")
+
+# Elements cut from HTML before parsing; they never contain visible text
+_HEAVY_TAGS = ("script", "style", "noscript")
+# Length-preserving lowercase (str.lower() can change length for some non-ASCII characters)
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+# OpenAI SDK retry/timeout policy; the SDK backs off with jitter and honours Retry-After
+LLM_MAX_RETRIES = 5
+LLM_TIMEOUT = 120.0
+
+# Connection pool shared by all LLM requests; sized above CONCURRENCY so
+# polling and retries don't queue behind in-flight extractions
+LLM_MAX_CONNECTIONS = 64
+LLM_MAX_KEEPALIVE = 32
+
+# Scaffolds normalize_result fills in when the LLM omits totals or extras
+_NOT_FOUND = MappingProxyType({"status": "not_found", "value": None, "notes": None})
+_TOTALS_DEFAULTS = MappingProxyType({
+    "total_quote": _NOT_FOUND,
+    "guestroom_total": _NOT_FOUND,
+    "meeting_room_total": _NOT_FOUND,
+    "fnb_total": _NOT_FOUND,
+})
+_EXTRAS_DEFAULTS = MappingProxyType({
+    "room_nights": None,
+    "nightly_rate": None,
+    "guestroom_base": None,
+    "guestroom_taxes_fees": None,
+    "estimated_fnb_gross": None,
+    "effective_value_offsets": [],
+    "proposal_url": None,
+})
+
+# Characters of document text sent to the LLM
+MAX_CHARS = 180_000
+
+# Longer documents are narrowed to the densest run of quote anchors: at most
+# QUOTE_WINDOW_CHARS, with QUOTE_WINDOW_PAD of context either side of the anchors
+QUOTE_WINDOW_CHARS = 60_000
+QUOTE_WINDOW_PAD = 2_000
+# Characters of document text extracted and searched for that window
+QUOTE_SCAN_CHARS = 2_000_000
+_RE_QUOTE_ANCHOR = re.compile(
+    r"total\s+quote|guest\s*rooms?|f\s*&\s*b\s+minimum|food\s+(?:and|&)\s+beverage|room\s+nights?|\$\d[\d,]*",
+    re.I,
+)
+
+# Files processed at once by main(); each holds one in-flight LLM request
+CONCURRENCY = int(os.getenv("HQP_CONCURRENCY", "12"))
+
+# Seconds between Batch API status checks, doubling up to the maximum
+BATCH_POLL_INITIAL = 5
+BATCH_POLL_MAX = 60
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
 
 # -------------------- Extraction helpers --------------------
 def _extract_pdf_unstructured(path: str) -> Optional[str]:
+    partition = _backend("unstructured.partition.pdf")
+    if partition is None:
+        return None
     try:
-        from unstructured.partition.pdf import partition_pdf
-        elems = partition_pdf(path, strategy="hi_res")
+        elems = partition.partition_pdf(path, strategy="hi_res")
         return "\n".join(str(e) for e in elems)
     except Exception:
         return None
 
-def _extract_pdf_pypdf2(path: str) -> Optional[str]:
+def _extract_pdf_pypdf2(path: str, limit: Optional[int] = None) -> Optional[str]:
+    # pypdf is the maintained successor of PyPDF2 with a faster text decoder; same API
+    if _backend("pypdf") is not None:
+        pdf = _backend("pypdf")
+        page_kwargs = {"extraction_mode": "plain"}  # No layout reconstruction; the LLM doesn't need columns
+    elif _backend("PyPDF2") is not None:
+        pdf = _backend("PyPDF2")
+        page_kwargs = {}
+    else:
+        return None
     try:
-        from PyPDF2 import PdfReader
-        reader = PdfReader(path)
+        reader = pdf.PdfReader(path)
+        # Only try the empty password; anything else can't be opened here anyway
+        if reader.is_encrypted and not reader.decrypt(""):
+            return None
         pages = []
+        total = 0
         for p in reader.pages:
             try:
-                pages.append(p.extract_text() or "")
+                page = p.extract_text(**page_kwargs) or ""
             except Exception:
-                pass
-        return "\n".join(pages).strip() or None
+                continue
+            pages.append(page)
+            total += len(page) + 1
+            # Pages past the limit would only be truncated away
+            if limit is not None and total >= limit:
+                break
+        text = "\n".join(pages).strip()
+        return (text[:limit] if limit is not None else text) or None
     except Exception:
         return None
 
-def _extract_html_bs4(path: str) -> Optional[str]:
+def _strip_heavy(html: str) -> str:
+    # Cut <script>/<style>/<noscript> elements with plain string search so the parser never builds them
+    lowered = html.translate(_ASCII_LOWER)
+    # "<!--" is tracked too so openers inside comments are skipped, not treated as elements
+    next_open = {t: lowered.find("<" + t) for t in _HEAVY_TAGS + ("!--",)}
+    keep = []
+    pos = 0
+    while True:
+        found = [(i, t) for t, i in next_open.items() if i != -1]
+        if not found:
+            break
+        start, tag = min(found)
+        if tag == "!--":
+            # Comments stay in (the parser drops them); only look for openers after them
+            end = lowered.find("-->", start + 4)
+            if end == -1:
+                break
+            resume = end + 3
+        else:
+            after = lowered[start + 1 + len(tag):start + 2 + len(tag)]
+            if after and after not in "> \t\r\n/":
+                # A longer tag name such as <styles>; keep looking past it
+                next_open[tag] = lowered.find("<" + tag, start + 1)
+                continue
+            close = lowered.find("</" + tag, start)
+            end = lowered.find(">", close) if close != -1 else -1
+            keep.append(html[pos:start])
+            if end == -1:
+                # Unclosed element runs to the end of the document, as in a browser
+                pos = len(html)
+                break
+            pos = resume = end + 1
+        for t, i in next_open.items():
+            if i != -1 and i < resume:
+                next_open[t] = lowered.find("<" + t, resume)
+    keep.append(html[pos:])
+    return "".join(keep)
+
+def _html_parser() -> str:
+    # lxml is much faster than the stdlib parser; use it when installed
+    return "lxml" if _backend("lxml") is not None else "html.parser"
+
+def _read_html(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return _strip_heavy(f.read())
+
+def _join_text(strings, limit: Optional[int] = None) -> str:
+    # Join text nodes the way get_text(separator="\n") does. With a limit, stop once
+    # the normalized text reaches it: later nodes can only change what follows, so
+    # the result equals the full text truncated to the limit
+    parts = []
+    raw = 0
+    next_check = limit
+    for s in strings:
+        parts.append(s)
+        raw += len(s) + 1
+        if limit is not None and raw >= next_check:
+            text = _RE_BLANKS.sub("\n", "\n".join(parts)).strip()
+            if len(text) >= limit:
+                return text[:limit]
+            # Normalizing only shrinks the raw text; wait for it to double before
+            # re-checking so the checks stay linear overall
+            next_check = 2 * raw
+    text = _RE_BLANKS.sub("\n", "\n".join(parts)).strip()
+    return text[:limit] if limit is not None else text
+
+def _extract_html_selectolax(path: str, limit: Optional[int] = None) -> Optional[str]:
+    # Native lexbor parser; fastest option when selectolax is installed
+    lexbor = _backend("selectolax.lexbor")
+    if lexbor is None:
+        return None
     try:
-        from bs4 import BeautifulSoup
+        tree = lexbor.LexborHTMLParser(_read_html(path))
+        for node in tree.css("script, style, noscript"):
+            node.decompose()
+        if tree.root is None:
+            return None
+        text = _RE_BLANKS.sub("\n", tree.root.text(separator="\n")).strip()
+        return text[:limit] if limit is not None else text
     except Exception:
         return None
+
+def _extract_html_lxml(path: str, limit: Optional[int] = None) -> Optional[str]:
+    lxml_html = _backend("lxml.html")
+    if lxml_html is None:
+        return None
     try:
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            html = f.read()
-        soup = BeautifulSoup(html, "html.parser")
+        doc = lxml_html.fromstring(_read_html(path))
+        for el in list(doc.iter("script", "style", "noscript")):
+            el.drop_tree()
+        return _join_text(doc.itertext(), limit)
+    except Exception:
+        return None
+
+def _extract_html_bs4(path: str, limit: Optional[int] = None) -> Optional[str]:
+    bs4 = _backend("bs4")
+    if bs4 is None:
+        return None
+    try:
+        soup = bs4.BeautifulSoup(_read_html(path), _html_parser())
         # Remove script/style
         for tag in soup(["script", "style", "noscript"]):
             tag.decompose()
         # Get visible text with reasonable spacing
-        text = soup.get_text(separator="\n")
-        return re.sub(r"\n{2,}", "\n", text).strip()
+        return _join_text(soup.strings, limit)
     except Exception:
         return None
 
@@ -81,29 +280,52 @@ def _extract_html_fallback(path: str) -> Optional[str]:
         with open(path, "r", encoding="utf-8", errors="ignore") as f:
             html = f.read()
         # strip tags
-        text = re.sub(r"<(script|style)[\s\S]*?</\1>", " ", html, flags=re.I)
-        text = re.sub(r"<[^>]+>", " ", text)
-        text = re.sub(r"\s+", " ", text)
+        text = _RE_SCRIPT_STYLE.sub(" ", html)
+        text = _RE_TAG.sub(" ", text)
+        text = _RE_WS.sub(" ", text)
         return text.strip()
     except Exception:
         return None
 
-def extract_text(path: str) -> str:
-    ext = Path(path).suffix.lower()
+def _read_plaintext(path: str, limit: Optional[int] = None) -> str:
+    if limit is None:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    # Map the file and decode only the prefix that can hold `limit` characters
+    # (UTF-8 needs at most 4 bytes each), instead of buffering the whole file
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm[:limit * 4]
+    # Universal newlines, as a text-mode read would give
+    text = data.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+    return text[:limit]
+
+def extract_text(path: str, ext: Optional[str] = None, limit: Optional[int] = None) -> str:
+    # ext overrides the path's suffix, for paths without one (e.g. /proc/self/fd/N).
+    # limit lets the PDF, HTML and plaintext readers stop early; the result may still exceed it.
+    ext = (ext or Path(path).suffix).lower()
     if ext == ".pdf":
-        # Try PyPDF2 first (more reliable with latest versions)
-        text = _extract_pdf_pypdf2(path) or _extract_pdf_unstructured(path)
+        # Try pypdf/PyPDF2 first (more reliable with latest versions). Any text from it is final;
+        # unstructured's hi_res OCR (and its heavy import) is only reached when neither is
+        # installed, the file can't be read, or there is no text layer at all (scanned PDFs).
+        text = _extract_pdf_pypdf2(path, limit)
+        if not text:
+            text = _extract_pdf_unstructured(path)
         if text: return text
         raise RuntimeError(f"Failed to extract text from PDF: {path}")
     elif ext in {".html", ".htm"}:
-        text = _extract_html_bs4(path) or _extract_html_fallback(path)
+        # Native parsers first, then bs4, then the regex fallback
+        text = (_extract_html_selectolax(path, limit) or _extract_html_lxml(path, limit)
+                or _extract_html_bs4(path, limit) or _extract_html_fallback(path))
         if text: return text
         raise RuntimeError(f"Failed to extract text from HTML: {path}")
     else:
         # treat as plaintext
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
+        return _read_plaintext(path, limit)
 
+@functools.lru_cache(maxsize=None)
 def read_prompt(path: Optional[str]) -> str:
     # First try the provided path
     if path:
@@ -120,88 +342,191 @@ def read_prompt(path: Optional[str]) -> str:
     # Built-in default prompt (short)
     return """Extract hotel quote data into JSON with totals, extras, and calculations. Include property info, program details, fees, policies, concessions, and calculated totals with status fields (explicit, derived, conditional, not_found)."""
 
+def _http_client_kwargs() -> Dict[str, Any]:
+    import httpx
+    # HTTP/2 lets concurrent requests share one TLS connection; it needs the h2 package
+    return {
+        "http2": _backend("h2") is not None,
+        "follow_redirects": True,  # As the SDK's own client does
+        "limits": httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE),
+        "timeout": LLM_TIMEOUT,
+    }
+
+@functools.lru_cache(maxsize=1)
 def get_client():
+    # One client per process so its connection pool and TLS sessions are reused
     try:
+        import httpx
         from openai import OpenAI
-        return OpenAI()
+        return OpenAI(max_retries=LLM_MAX_RETRIES, timeout=LLM_TIMEOUT,
+                      http_client=httpx.Client(**_http_client_kwargs()))
+    except Exception as e:
+        raise RuntimeError("Install the OpenAI SDK v1+: pip install openai") from e
+
+def get_async_client():
+    try:
+        import httpx
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(max_retries=LLM_MAX_RETRIES, timeout=LLM_TIMEOUT,
+                           http_client=httpx.AsyncClient(**_http_client_kwargs()))
     except Exception as e:
         raise RuntimeError("Install the OpenAI SDK v1+: pip install openai") from e
 
 def get_model(cli: Optional[str]) -> str:
     return cli or os.getenv("OPENAI_MODEL") or "gpt-4o-mini"
 
-def _truncate(text: str, max_chars: int = 180_000) -> str:
+def _truncate(text: str, max_chars: int = MAX_CHARS) -> str:
     return text if len(text) <= max_chars else text[:max_chars]
 
-def call_llm(client, model: str, system_prompt: str, content: str) -> Dict[str, Any]:
-    # Simple retry logic without external dependencies
-    max_retries = 3
-    for attempt in range(max_retries):
+def _locate_quote_window(text: str) -> str:
+    if len(text) <= QUOTE_WINDOW_CHARS:
+        return text
+    hits = [m.start() for m in _RE_QUOTE_ANCHOR.finditer(text)]
+    if not hits:
+        return _truncate(text)
+    # Two-pointer scan for the span holding the most anchors that still fits the window
+    span = QUOTE_WINDOW_CHARS - 2 * QUOTE_WINDOW_PAD
+    best_lo, best_count, lo = 0, 0, 0
+    for hi, pos in enumerate(hits):
+        while pos - hits[lo] > span:
+            lo += 1
+        if hi - lo + 1 > best_count:
+            best_lo, best_count = lo, hi - lo + 1
+    start = max(0, hits[best_lo] - QUOTE_WINDOW_PAD)
+    return text[start:start + QUOTE_WINDOW_CHARS]
+
+# Fixed instruction sent after the system prompt; the document itself is the only varying message
+TASK_INSTRUCTION = "Extract and analyze the hotel quote data from the document in the next message."
+
+@functools.lru_cache(maxsize=4)
+def _system_messages(system_prompt: str, instruction: str) -> Tuple[Dict[str, str], Dict[str, str]]:
+    # Built once per run and shared by every request; the SDK only reads them
+    return (
+        {"role": "system", "content": system_prompt},
+        {"role": "system", "content": instruction},
+    )
+
+def _messages(system_prompt: str, content: str) -> List[Dict[str, str]]:
+    # Everything before the document is identical across calls, so OpenAI's
+    # automatic prompt caching can reuse it once the prefix reaches 1024 tokens
+    return [*_system_messages(system_prompt, TASK_INSTRUCTION), {"role": "user", "content": content}]
+
+# Instruction for requests that carry several documents (see acall_llm_multi)
+MULTI_TASK_INSTRUCTION = (
+    "The next message contains several documents, each wrapped in [id=...] and [/id=...] markers. "
+    "Extract and analyze the hotel quote data from each one independently and return a JSON object "
+    "keyed by id whose values are the extraction for that document."
+)
+
+def _multi_messages(system_prompt: str, docs: List[Tuple[str, str]]) -> List[Dict[str, str]]:
+    body = "\n".join(f"[id={doc_id}]\n{text}\n[/id={doc_id}]" for doc_id, text in docs)
+    return [*_system_messages(system_prompt, MULTI_TASK_INSTRUCTION), {"role": "user", "content": body}]
+
+def _cached_tokens(resp) -> int:
+    # Prompt tokens served from OpenAI's prompt cache (0 if the SDK doesn't report them)
+    details = getattr(getattr(resp, "usage", None), "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+def parse_llm_output(out: str) -> Dict[str, Any]:
+    # json_object mode returns a bare JSON object, so try parsing it directly first
+    try:
+        result = _loads(out)
+    except ValueError:
+        # Extract last JSON object in case of any wrapper
+        m = _RE_JSON_TAIL.search(out)
         try:
-            resp = client.chat.completions.create(
-                model=model,
-                temperature=0.1,
-                response_format={"type": "json_object"},
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Extract and analyze the hotel quote data from this document:\n\n{content}"},
-                ],
-            )
-            out = resp.choices[0].message.content or ""
-            # Extract last JSON object in case of any wrapper
-            m = re.search(r"\{[\s\S]*\}\s*$", out)
-            j = m.group(0) if m else out
-            try:
-                result = json.loads(j)
-                # Validate and normalize the result structure
-                return normalize_result(result)
-            except Exception:
-                return {"raw": out, "error": "Failed to parse JSON response"}
-        except Exception as e:
-            if attempt == max_retries - 1:
-                raise e
-            import time
-            time.sleep(2 ** attempt)  # Exponential backoff
+            result = _loads(m.group(0)) if m else None
+        except ValueError:
+            result = None
+    if not isinstance(result, dict):
+        return {"raw": out, "error": "Failed to parse JSON response"}
+    # Validate and normalize the result structure
+    return normalize_result(result)
+
+def call_llm(client, model: str, system_prompt: str, content: str) -> Dict[str, Any]:
+    # Transient failures are retried by the client (see get_client)
+    resp = client.chat.completions.create(
+        model=model,
+        temperature=0.1,
+        response_format={"type": "json_object"},
+        messages=_messages(system_prompt, content),
+    )
+    return parse_llm_output(resp.choices[0].message.content or "")
+
+async def acall_llm(client, model: str, system_prompt: str, content: str) -> Dict[str, Any]:
+    # Async variant of call_llm for an AsyncOpenAI client
+    resp = await client.chat.completions.create(
+        model=model,
+        temperature=0.1,
+        response_format={"type": "json_object"},
+        messages=_messages(system_prompt, content),
+    )
+    cached = _cached_tokens(resp)
+    if cached:
+        print(f"    cached prompt tokens: {cached}")
+    return parse_llm_output(resp.choices[0].message.content or "")
+
+async def acall_llm_multi(client, model: str, system_prompt: str, docs: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+    # One request for several small documents; returns {doc_id: result}
+    resp = await client.chat.completions.create(
+        model=model,
+        temperature=0.1,
+        response_format={"type": "json_object"},
+        messages=_multi_messages(system_prompt, docs),
+    )
+    out = resp.choices[0].message.content or ""
+    try:
+        by_id = _loads(out)
+    except ValueError:
+        by_id = None
+    results = {}
+    for doc_id, _ in docs:
+        item = by_id.get(doc_id) if isinstance(by_id, dict) else None
+        if isinstance(item, dict):
+            results[doc_id] = normalize_result(item)
+        else:
+            results[doc_id] = {"raw": out, "error": f"No result for document {doc_id} in multi-document response"}
+    return results
+
+def call_llm_stream(client, model: str, system_prompt: str, content: str) -> Iterator[str]:
+    # Yields the reply as it is generated; join the deltas and pass them to parse_llm_output.
+    # No retries: deltas already handed to the caller can't be taken back.
+    stream = client.chat.completions.create(
+        model=model,
+        temperature=0.1,
+        response_format={"type": "json_object"},
+        messages=_messages(system_prompt, content),
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
 
 def normalize_result(result: Dict[str, Any]) -> Dict[str, Any]:
-    """Normalize the result to ensure it matches the expected schema"""
-    normalized = {
-        "property": result.get("property", {}),
-        "program": result.get("program", {}),
-        "fees": result.get("fees", {}),
-        "agenda": result.get("agenda", []),
-        "policies": result.get("policies", {}),
-        "concessions": result.get("concessions", []),
-        "notes": result.get("notes"),
-        "totals": result.get("totals", {}),
-        "extras": result.get("extras", {})
-    }
+    """Normalize the result in place to ensure it matches the expected schema"""
+    result.setdefault("property", {})
+    result.setdefault("program", {})
+    result.setdefault("fees", {})
+    result.setdefault("agenda", [])
+    result.setdefault("policies", {})
+    result.setdefault("concessions", [])
+    result.setdefault("notes", None)
     
-    # Ensure totals structure exists
-    if "totals" not in normalized or not normalized["totals"]:
-        normalized["totals"] = {
-            "total_quote": {"status": "not_found", "value": None, "notes": None},
-            "guestroom_total": {"status": "not_found", "value": None, "notes": None},
-            "meeting_room_total": {"status": "not_found", "value": None, "notes": None},
-            "fnb_total": {"status": "not_found", "value": None, "notes": None}
-        }
+    # Ensure totals structure exists (fresh copies: callers fill in amounts)
+    if not result.get("totals"):
+        result["totals"] = {name: dict(entry) for name, entry in _TOTALS_DEFAULTS.items()}
     
     # Ensure extras structure exists
-    if "extras" not in normalized or not normalized["extras"]:
-        normalized["extras"] = {
-            "room_nights": None,
-            "nightly_rate": None,
-            "guestroom_base": None,
-            "guestroom_taxes_fees": None,
-            "estimated_fnb_gross": None,
-            "effective_value_offsets": [],
-            "proposal_url": None
-        }
+    if not result.get("extras"):
+        result["extras"] = {name: (list(value) if isinstance(value, list) else value)
+                            for name, value in _EXTRAS_DEFAULTS.items()}
     
-    return normalized
+    return result
+
+SUPPORTED_EXTENSIONS = (".pdf", ".html", ".htm", ".txt")
 
 def is_supported_file(p: Path) -> bool:
-    return p.is_file() and p.suffix.lower() in {".pdf", ".html", ".htm", ".txt"}
+    return p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS
 
 def discover_inputs(input_path: Path) -> List[Path]:
     if input_path.is_file():
@@ -209,31 +534,251 @@ def discover_inputs(input_path: Path) -> List[Path]:
             return [input_path]
         raise FileNotFoundError(f"Unsupported file type: {input_path.suffix}")
     elif input_path.is_dir():
-        return sorted([p for p in input_path.iterdir() if is_supported_file(p)])
+        # DirEntry.is_file() uses the type from readdir, avoiding a stat per entry
+        with os.scandir(input_path) as it:
+            return sorted(Path(e.path) for e in it
+                          if e.name.lower().endswith(SUPPORTED_EXTENSIONS) and e.is_file())
     else:
         raise FileNotFoundError(f"Path not found: {input_path}")
 
-def process_file(path: str, prompt_path: Optional[str], out_dir: str, model: str) -> Path:
-    print(f"[+] Processing {path}")
-    text = extract_text(path)
-    text = _truncate(text)
-    client = get_client()
-    system_prompt = read_prompt(prompt_path)
-    result = call_llm(client, model, system_prompt, text)
-
+def write_result(path: str, out_dir: str, result: Dict[str, Any]) -> Path:
     Path(out_dir).mkdir(parents=True, exist_ok=True)
     out_path = Path(out_dir) / (Path(path).stem + ".json")
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(result, f, indent=2, ensure_ascii=False)
+    out_path.write_bytes(_dumps(result, indent=True))
     print(f"    -> {out_path}")
     return out_path
 
+def _extraction_pool(n_inputs: int) -> Optional[ProcessPoolExecutor]:
+    # PDF/HTML parsing is pure-Python CPU work that holds the GIL, so spread it over processes
+    if n_inputs < 2:
+        return None
+    return ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, n_inputs))
+
+async def _extract_async(path: str, pool: Optional[ProcessPoolExecutor]) -> str:
+    # Runs extract_text in the pool (or a thread without one) so it overlaps with in-flight LLM requests
+    return await asyncio.get_running_loop().run_in_executor(pool, extract_text, path, None, QUOTE_SCAN_CHARS)
+
+def _cache_lookup(cache_dir: Optional[str], model: str, system_prompt: str, text: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+    # Returns (key, cached result); both None when caching is off
+    if not cache_dir:
+        return None, None
+    key = extraction_cache.cache_key("openai", model, system_prompt, text)
+    cached = extraction_cache.get(cache_dir, key)
+    if cached is not None:
+        print(f"    cache hit: {key}")
+        return key, normalize_result(cached)
+    return key, None
+
+def _cache_store(cache_dir: Optional[str], key: Optional[str], result: Dict[str, Any]) -> None:
+    if key and "error" not in result:
+        extraction_cache.put(cache_dir, key, result)
+
+async def process_file(path: str, prompt_path: Optional[str], out_dir: str, model: str, client, sem: asyncio.Semaphore,
+                       cache_dir: Optional[str] = None, pool: Optional[ProcessPoolExecutor] = None) -> Path:
+    async with sem:
+        print(f"[+] Processing {path}")
+        text = await _extract_async(path, pool)
+        text = _locate_quote_window(text)
+        system_prompt = read_prompt(prompt_path)
+
+        key, result = _cache_lookup(cache_dir, model, system_prompt, text)
+        if result is None:
+            result = await acall_llm(client, model, system_prompt, text)
+            _cache_store(cache_dir, key, result)
+    return write_result(path, out_dir, result)
+
+async def process_all(inputs: List[Path], prompt_path: Optional[str], out_dir: str, model: str,
+                      cache_dir: Optional[str] = None) -> None:
+    client = get_async_client()
+    sem = asyncio.Semaphore(CONCURRENCY)
+    pool = _extraction_pool(len(inputs))
+    try:
+        results = await asyncio.gather(
+            *(process_file(str(p), prompt_path, out_dir, model, client, sem, cache_dir, pool) for p in inputs),
+            return_exceptions=True,
+        )
+    finally:
+        await client.close()
+        if pool:
+            pool.shutdown()
+    for p, result in zip(inputs, results):
+        if isinstance(result, Exception):
+            print(f"[!] Failed on {p}: {result}")
+
+def _pack(docs: List[Tuple[str, str]], max_chars: int) -> List[List[Tuple[str, str]]]:
+    # Greedily group consecutive documents whose combined text fits in max_chars;
+    # anything larger on its own gets a group to itself
+    groups = []
+    current = []
+    size = 0
+    for doc in docs:
+        if current and size + len(doc[1]) > max_chars:
+            groups.append(current)
+            current = []
+            size = 0
+        current.append(doc)
+        size += len(doc[1])
+    if current:
+        groups.append(current)
+    return groups
+
+async def process_packed(inputs: List[Path], prompt_path: Optional[str], out_dir: str, model: str,
+                         pack_chars: int, cache_dir: Optional[str] = None) -> None:
+    # Like process_all, but small documents share one LLM request (up to pack_chars of text)
+    system_prompt = read_prompt(prompt_path)
+    pool = _extraction_pool(len(inputs))
+    try:
+        extracted = await asyncio.gather(*(_extract_async(str(p), pool) for p in inputs), return_exceptions=True)
+    finally:
+        if pool:
+            pool.shutdown()
+
+    pending = []
+    keys = {}
+    for i, (p, text) in enumerate(zip(inputs, extracted)):
+        if isinstance(text, Exception):
+            print(f"[!] Failed on {p}: {text}")
+            continue
+        text = _locate_quote_window(text)
+        key, cached = _cache_lookup(cache_dir, model, system_prompt, text)
+        if cached is not None:
+            write_result(str(p), out_dir, cached)
+        else:
+            keys[str(i)] = key
+            pending.append((str(i), text))
+
+    client = get_async_client()
+    sem = asyncio.Semaphore(CONCURRENCY)
+    async def run_group(group: List[Tuple[str, str]]) -> Dict[str, Dict[str, Any]]:
+        async with sem:
+            print(f"[+] Processing {', '.join(str(inputs[int(doc_id)]) for doc_id, _ in group)}")
+            if len(group) == 1:
+                doc_id, text = group[0]
+                return {doc_id: await acall_llm(client, model, system_prompt, text)}
+            results = await acall_llm_multi(client, model, system_prompt, group)
+            # Retry on their own any documents the model dropped or mangled
+            for doc_id, text in group:
+                if "error" in results[doc_id]:
+                    results[doc_id] = await acall_llm(client, model, system_prompt, text)
+            return results
+
+    groups = _pack(pending, pack_chars)
+    try:
+        results = await asyncio.gather(*(run_group(g) for g in groups), return_exceptions=True)
+    finally:
+        await client.close()
+    for group, result in zip(groups, results):
+        for doc_id, _ in group:
+            p = inputs[int(doc_id)]
+            if isinstance(result, Exception):
+                print(f"[!] Failed on {p}: {result}")
+                continue
+            _cache_store(cache_dir, keys[doc_id], result[doc_id])
+            write_result(str(p), out_dir, result[doc_id])
+
+def _batch_request(custom_id: str, model: str, system_prompt: str, content: str) -> Dict[str, Any]:
+    # One Batch API input line; the body matches what call_llm sends
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "temperature": 0.1,
+            "response_format": {"type": "json_object"},
+            "messages": _messages(system_prompt, content),
+        },
+    }
+
+async def submit_batch(client, docs: List[Tuple[str, str]], model: str, system_prompt: str) -> Dict[str, Dict[str, Any]]:
+    # Runs (custom_id, text) documents as one Batch API job and returns {custom_id: result}; failed requests are omitted
+    with tempfile.TemporaryFile("w+b", suffix=".jsonl") as f:
+        for custom_id, text in docs:
+            f.write(_dumps(_batch_request(custom_id, model, system_prompt, text)))
+            f.write(b"\n")
+        f.seek(0)
+        batch_file = await client.files.create(file=("requests.jsonl", f), purpose="batch")
+
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    print(f"Batch: {batch.id}")
+
+    delay = BATCH_POLL_INITIAL
+    while batch.status not in BATCH_TERMINAL_STATUSES:
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, BATCH_POLL_MAX)
+        batch = await client.batches.retrieve(batch.id)
+        print(f"    status: {batch.status}")
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+
+    results = {}
+    output = await client.files.content(batch.output_file_id)
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        item = _loads(line)
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            print(f"[!] Failed on {item['custom_id']}: {item.get('error') or response.get('body')}")
+            continue
+        results[item["custom_id"]] = parse_llm_output(response["body"]["choices"][0]["message"]["content"] or "")
+    return results
+
+async def process_batch(inputs: List[Path], prompt_path: Optional[str], out_dir: str, model: str,
+                        cache_dir: Optional[str] = None) -> None:
+    # Like process_packed, but every uncached document goes into one Batch API job
+    system_prompt = read_prompt(prompt_path)
+    client = get_async_client()
+    try:
+        # Older SDKs (e.g. the microservice's openai==1.3.7 pin) predate the Batch API
+        if not hasattr(client, "batches"):
+            raise RuntimeError("--batch needs an OpenAI SDK with Batch API support: pip install -U openai")
+
+        pool = _extraction_pool(len(inputs))
+        try:
+            extracted = await asyncio.gather(*(_extract_async(str(p), pool) for p in inputs), return_exceptions=True)
+        finally:
+            if pool:
+                pool.shutdown()
+
+        pending = []
+        keys = {}
+        for p, text in zip(inputs, extracted):
+            if isinstance(text, Exception):
+                print(f"[!] Failed on {p}: {text}")
+                continue
+            text = _locate_quote_window(text)
+            key, cached = _cache_lookup(cache_dir, model, system_prompt, text)
+            if cached is not None:
+                write_result(str(p), out_dir, cached)
+            else:
+                keys[str(p)] = key
+                pending.append((str(p), text))
+
+        results = await submit_batch(client, pending, model, system_prompt) if pending else {}
+    finally:
+        await client.close()
+    for custom_id, _ in pending:
+        if custom_id in results:
+            _cache_store(cache_dir, keys[custom_id], results[custom_id])
+            write_result(custom_id, out_dir, results[custom_id])
+        else:
+            print(f"[!] No batch result for {custom_id}")
+
 def main():
     ap = argparse.ArgumentParser(description="Extract hotel quote metadata from emails, PDFs, or HTML proposals.")
     ap.add_argument("--input", required=True, help="Path to a file or directory (.pdf, .html/.htm, .txt)")
     ap.add_argument("--out", required=True, help="Output directory for JSON")
     ap.add_argument("--prompt", default=None, help="Custom system prompt file (optional)")
     ap.add_argument("--model", default=None, help="OpenAI model (default from OPENAI_MODEL or gpt-4o-mini)")
+    ap.add_argument("--cache-dir", default=None, help="Directory for cached extractions keyed by model, prompt and document text (optional)")
+    ap.add_argument("--pack-chars", type=int, default=0, help="Send small documents together, up to this many characters per request (default 0: one per request)")
+    ap.add_argument("--batch", action="store_true", help="Submit all files as one OpenAI Batch API job (cheaper, completes within 24h)")
     args = ap.parse_args()
 
     if not os.getenv("OPENAI_API_KEY"):
@@ -244,11 +789,12 @@ def main():
 
     print(f"Model: {model}")
     print(f"Files: {len(inputs)}")
-    for p in inputs:
-        try:
-            process_file(str(p), args.prompt, args.out, model)
-        except Exception as e:
-            print(f"[!] Failed on {p}: {e}")
+    if args.batch:
+        asyncio.run(process_batch(inputs, args.prompt, args.out, model, args.cache_dir))
+    elif args.pack_chars > 0:
+        asyncio.run(process_packed(inputs, args.prompt, args.out, model, args.pack_chars, args.cache_dir))
+    else:
+        asyncio.run(process_all(inputs, args.prompt, args.out, model, args.cache_dir))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,35 @@
+# Content-addressable cache of normalized extraction results.
+#
+# Entries live at <cache_dir>/<key>.json, where the key hashes the provider,
+# model, system prompt and the exact (truncated) document text sent to the LLM.
+
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+def cache_key(provider: str, model: str, prompt: str, text: str) -> str:
+    # Length-prefix each part so different splits of the same bytes can't collide
+    parts = [x.encode("utf-8") for x in (provider, model, prompt, text)]
+    return hashlib.sha256(b"\x00".join(len(x).to_bytes(8, "little") + x for x in parts)).hexdigest()
+
+def get(cache_dir: str, key: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(Path(cache_dir) / f"{key}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def put(cache_dir: str, key: str, value: Dict[str, Any]) -> None:
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    # Write then rename so concurrent readers never see a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(tmp_path, Path(cache_dir) / f"{key}.json")
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
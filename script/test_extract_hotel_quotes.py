@@ -0,0 +1,25 @@
+"""
+Tests for the text extraction helpers (no OpenAI calls)
+"""
+
+import random
+
+from extract_hotel_quotes import _join_text, _strip_heavy, extract_text
+
+def test_join_text_limit_matches_truncated_full_text():
+    """Stopping early at a limit gives exactly the full text cut to that limit"""
+    rng = random.Random(0)
+    pieces = ["quote", "$1,250", " ", "\n", "\n\n", "\t", ""]
+    for _ in range(5000):
+        strings = ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 5))) for _ in range(rng.randint(0, 40))]
+        limit = rng.randint(1, 80)
+        assert _join_text(iter(strings), limit) == _join_text(strings)[:limit]
+
+def test_strip_heavy_ignores_openers_inside_comments(tmp_path):
+    """A <script> inside a comment must not swallow the page up to the next </script>"""
+    html = "<p>A</p><!-- <script> --> <p>B</p> <script>x</script><p>C</p>"
+    assert _strip_heavy(html) == "<p>A</p><!-- <script> --> <p>B</p> <p>C</p>"
+    
+    path = tmp_path / "quote.html"
+    path.write_text(html)
+    assert extract_text(str(path)).split() == ["A", "B", "C"]